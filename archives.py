@@ -1,8 +1,13 @@
+import collections
+import os
 import re
 import subprocess
+import tempfile
 import zipfile
 import zlib
 
+import sevenzip
+
 compressed_exts = ['7z', 'zip', 'gz', 'bz2', 'tar', 'tgz', 'tbz']
 #7z supports more, but I don't expect to see them (in the case of things like .rar, I don't want them to be treated as
 #valid archive types because they're evil proprietary formats and I want to eradicate them, and the case of things
@@ -10,38 +15,77 @@ compressed_exts = ['7z', 'zip', 'gz', 'bz2', 'tar', 'tgz', 'tbz']
 class Bad7zException(Exception):
 	pass
 
+class DecompressedSizeMismatchException(Exception):
+	pass
+
 def zip_list(path):
 	with zipfile.ZipFile(path, 'r') as zip_file:
 		return zip_file.namelist()
 
 sevenzip_path_regex = re.compile(r'^Path\s+=\s+(.+)$', flags=re.IGNORECASE)
 sevenzip_attr_regex = re.compile(r'^Attributes\s+=\s+(.+)$', flags=re.IGNORECASE)
-def sevenzip_list(path):
-	#This is rather slow…
-	proc = subprocess.run(['7z', 'l', '-slt', path], stdout=subprocess.PIPE, universal_newlines=True, check=False)
+sevenzip_size_reg = re.compile(r'^Size\s+=\s+(\d+)$', flags=re.IGNORECASE)
+sevenzip_crc_regex = re.compile(r'^CRC\s+=\s+([0-9A-Fa-f]+)$', flags=re.IGNORECASE)
+def sevenzip_list_entries(path, filename=None):
+	#Returns [(name, size, crc32)], where name ends with / for directories and crc32 is None if 7z doesn't tell us
+	try:
+		entries = [(entry.name.replace('\\', '/') + '/' if entry.is_directory else entry.name.replace('\\', '/'), entry.size, entry.crc32) for entry in sevenzip.read_entries(path)]
+	except sevenzip.SevenZipHeaderException:
+		#Not actually a .7z (could be .gz or .tar or whatever else 7z understands), or something we can't read ourselves
+		return _sevenzip_list_entries_with_7z(path, filename)
+	if filename:
+		return [entry for entry in entries if entry[0].rstrip('/') == filename]
+	return entries
+
+def _sevenzip_list_entries_with_7z(path, filename=None):
+	args = ['7z', 'l', '-slt', path]
+	if filename:
+		args.append(filename)
+	proc = subprocess.run(args, stdout=subprocess.PIPE, universal_newlines=True, check=False)
 	if proc.returncode != 0:
 		raise Bad7zException('{0}: {1} {2}'.format(path, proc.returncode, proc.stdout))
 
-	files = []
+	entries = []
 	found_file_line = False
 	inner_filename = None
 	is_directory = False
+	size = None
+	crc = None
 	for line in proc.stdout.splitlines():
 		if line.startswith('------'):
 			found_file_line = True
 			continue
+		if not found_file_line:
+			continue
+
 		sevenzip_path_match = sevenzip_path_regex.fullmatch(line)
-		if found_file_line and sevenzip_path_match:
+		if sevenzip_path_match:
 			if inner_filename is not None:
-				files.append(inner_filename + '/' if is_directory else inner_filename)
+				entries.append((inner_filename + '/' if is_directory else inner_filename, size, crc))
 			inner_filename = sevenzip_path_match.group(1)
+			is_directory = False
+			size = None
+			crc = None
 			continue
 		sevenzip_attr_match = sevenzip_attr_regex.fullmatch(line)
-		if found_file_line and sevenzip_attr_match:
+		if sevenzip_attr_match:
 			is_directory = sevenzip_attr_match.group(1)[:2] == 'D_'
-	files.append(inner_filename + '/' if is_directory else inner_filename)
+			continue
+		sevenzip_size_match = sevenzip_size_reg.fullmatch(line)
+		if sevenzip_size_match:
+			size = int(sevenzip_size_match.group(1))
+			continue
+		sevenzip_crc_match = sevenzip_crc_regex.fullmatch(line)
+		if sevenzip_crc_match:
+			crc = int(sevenzip_crc_match.group(1), 16)
+	if inner_filename is not None:
+		entries.append((inner_filename + '/' if is_directory else inner_filename, size, crc))
+
+	return entries
 
-	return files
+def sevenzip_list(path):
+	#This is rather slow…
+	return [name for name, _, _ in sevenzip_list_entries(path)]
 	
 def compressed_list(path):
 	if zipfile.is_zipfile(path):
@@ -56,20 +100,10 @@ def zip_getsize(path, filename):
 	with zipfile.ZipFile(path, 'r') as zip_file:
 		return zip_file.getinfo(filename).file_size
 
-sevenzip_size_reg = re.compile(r'^Size\s+=\s+(\d+)$', flags=re.IGNORECASE)
 def sevenzip_getsize(path, filename):
-	proc = subprocess.run(['7z', 'l', '-slt', path, filename], stdout=subprocess.PIPE, universal_newlines=True, check=False)
-	if proc.returncode != 0:
-		raise Bad7zException('{0}: {1} {2}'.format(path, proc.returncode, proc.stdout))
-
-	found_file_line = False
-	for line in proc.stdout.splitlines():
-		if line.startswith('------'):
-			found_file_line = True
-			continue
-		if found_file_line and sevenzip_size_reg.fullmatch(line):
-			return int(sevenzip_size_reg.fullmatch(line).group(1))
-
+	for name, size, _ in sevenzip_list_entries(path, filename):
+		if name == filename:
+			return size
 	return None
 
 def compressed_getsize(path, filename):
@@ -97,6 +131,117 @@ def compressed_get(path, filename):
 			pass
 	return sevenzip_get(path, filename)
 
+def sevenzip_iter_chunks(path, filename, chunk_size):
+	with subprocess.Popen(['7z', 'e', '-so', path, filename], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+		yield from iter(lambda: proc.stdout.read(chunk_size), b'')
+		#Otherwise if 7z fails partway through, whatever it managed to get out before then would look like the whole thing
+		if proc.wait() != 0:
+			raise Bad7zException('{0}: 7z returned {1} extracting {2}'.format(path, proc.returncode, filename))
+
+def _read_range_from_chunks(chunks, seek_to=0, amount=-1):
+	#Throws away everything before seek_to instead of holding the whole thing in memory just to slice it
+	parts = []
+	position = 0
+	for chunk in chunks:
+		chunk_end = position + len(chunk)
+		if chunk_end > seek_to:
+			start = max(seek_to - position, 0)
+			if amount > -1:
+				end = min(seek_to + amount - position, len(chunk))
+				parts.append(chunk[start:end])
+				if position + end >= seek_to + amount:
+					break
+			else:
+				parts.append(chunk[start:])
+		position = chunk_end
+	return b''.join(parts)
+
+def zip_read_range(path, filename, seek_to=0, amount=-1):
+	with zipfile.ZipFile(path) as zip_file:
+		with zip_file.open(filename, 'r') as file:
+			#Seeking in a zip member still has to decompress everything before it, but at least it doesn't keep it around or bother with anything after it
+			file.seek(seek_to)
+			return file.read(amount)
+
+def sevenzip_read_range(path, filename, seek_to=0, amount=-1):
+	return _read_range_from_chunks(sevenzip_iter_chunks(path, filename, 16 * 1024 * 1024), seek_to, amount)
+
+def compressed_read_range(path, filename, seek_to=0, amount=-1):
+	if zipfile.is_zipfile(path):
+		try:
+			return zip_read_range(path, filename, seek_to, amount)
+		except zipfile.BadZipFile:
+			pass
+	return sevenzip_read_range(path, filename, seek_to, amount)
+
+class DecompressedMemberCache():
+	def __init__(self, budget):
+		self.budget = budget
+		self.used = 0
+		self._files = collections.OrderedDict() #(path, filename, size, mtime) -> (file, size)
+
+	def _key(self, path, filename):
+		stat = os.stat(path)
+		return (path, filename, stat.st_size, stat.st_mtime_ns)
+
+	def get(self, path, filename):
+		try:
+			key = self._key(path, filename)
+		except OSError:
+			return None
+		if key not in self._files:
+			return None
+		self._files.move_to_end(key)
+		return self._files[key][0]
+
+	def put(self, path, filename, size, chunks):
+		if size is None or size > self.budget:
+			return None
+		try:
+			key = self._key(path, filename)
+		except OSError:
+			return None
+		while self._files and self.used + size > self.budget:
+			_, (old_file, old_size) = self._files.popitem(last=False)
+			old_file.close()
+			self.used -= old_size
+
+		#TemporaryFile gets deleted as soon as it's closed (or we exit), so nothing is left lying around
+		file = tempfile.TemporaryFile(prefix='meow-launcher-')
+		written = 0
+		try:
+			for chunk in chunks:
+				written += file.write(chunk)
+		except (OSError, EOFError, zlib.error, zipfile.BadZipFile, Bad7zException):
+			file.close()
+			raise
+		if written != size:
+			#Something went wrong decompressing it, and we don't want to keep giving that out for the rest of the run
+			file.close()
+			raise DecompressedSizeMismatchException('{0}: {1} should be {2} bytes, but got {3}'.format(path, filename, size, written))
+		self._files[key] = (file, size)
+		self.used += size
+		return file
+
+	def clear(self):
+		for file, _ in self._files.values():
+			file.close()
+		self._files.clear()
+		self.used = 0
+
+_decompressed_member_cache = None
+_decompressed_member_cache_pid = None
+def get_decompressed_member_cache():
+	global _decompressed_member_cache, _decompressed_member_cache_pid
+	#Forked workers would otherwise share file positions with the parent, which would be bad
+	if _decompressed_member_cache is None or _decompressed_member_cache_pid != os.getpid():
+		#main_config imports io_utils which imports us, so this can't be imported at the top
+		from config.main_config import main_config
+		#Each process gets its own, so split it up between them, or else we'd be using that much space for each job
+		_decompressed_member_cache = DecompressedMemberCache(main_config.decompressed_member_cache_size // max(main_config.jobs, 1))
+		_decompressed_member_cache_pid = os.getpid()
+	return _decompressed_member_cache
+
 def get_zip_crc32(path, filename):
 	with zipfile.ZipFile(path) as zip_file:
 		return zip_file.getinfo(filename).CRC & 0xffffffff
@@ -107,6 +252,116 @@ def get_crc32_of_archive(path, filename):
 			return get_zip_crc32(path, filename)
 		except zipfile.BadZipFile:
 			pass
-	#TODO: Get them out of 7z, which might end up being faster than reading the whole thing
-	#See also https://fastapi.metacpan.org/source/BJOERN/Compress-Deflate7-1.0/7zip/DOC/7zFormat.txt
+	for name, _, crc in sevenzip_list_entries(path, filename):
+		if name == filename and crc is not None:
+			return crc
 	return zlib.crc32(sevenzip_get(path, filename)) & 0xffffffff
+
+class ArchiveHandle():
+	#Opens an archive once and remembers what's in it, so a RomFile can ask about its compressed entry as often as it likes without reopening the archive (or running 7z) every time
+	def __init__(self, path):
+		self.path = path
+		self._zip_file = None
+		self._is_zip = False
+		self._entries = {}
+		self._names = []
+		self._open_member = None #(filename, file object from ZipFile.open) for reading through a zip member without starting over each time
+
+		if zipfile.is_zipfile(path):
+			try:
+				self._zip_file = zipfile.ZipFile(path, 'r')
+				self._is_zip = True
+			except zipfile.BadZipFile:
+				pass
+
+		if self._is_zip:
+			for info in self._zip_file.infolist():
+				self._names.append(info.filename)
+				self._entries[info.filename] = (info.file_size, info.CRC & 0xffffffff)
+		else:
+			for name, size, crc in sevenzip_list_entries(path):
+				self._names.append(name)
+				self._entries[name] = (size, crc)
+
+	def _get_zip_file(self):
+		if self._is_zip and not self._zip_file:
+			#Something wanted to read from it again after it was closed, so open it back up
+			self._zip_file = zipfile.ZipFile(self.path, 'r')
+		return self._zip_file
+
+	def namelist(self):
+		return self._names
+
+	def getsize(self, filename):
+		return self._entries[filename][0]
+
+	def get_crc32(self, filename):
+		size, crc = self._entries[filename]
+		if crc is None:
+			#7z doesn't store a CRC for everything (empty files, for one), so we'll have to do it ourselves
+			crc = 0
+			for chunk in self.iter_chunks(filename):
+				crc = zlib.crc32(chunk, crc)
+			crc &= 0xffffffff
+			self._entries[filename] = (size, crc)
+		return crc
+
+	def iter_chunks(self, filename, chunk_size=16 * 1024 * 1024):
+		cached_file = get_decompressed_member_cache().get(self.path, filename)
+		if cached_file:
+			cached_file.seek(0)
+			yield from iter(lambda: cached_file.read(chunk_size), b'')
+			return
+		if self._is_zip:
+			with self._get_zip_file().open(filename, 'r') as file:
+				yield from iter(lambda: file.read(chunk_size), b'')
+		else:
+			yield from sevenzip_iter_chunks(self.path, filename, chunk_size)
+
+	def read(self, filename):
+		if self._is_zip:
+			return self._get_zip_file().read(filename)
+		return sevenzip_get(self.path, filename)
+
+	def _get_cached_member(self, filename):
+		cache = get_decompressed_member_cache()
+		cached_file = cache.get(self.path, filename)
+		if not cached_file:
+			cached_file = cache.put(self.path, filename, self.getsize(filename), self.iter_chunks(filename))
+		return cached_file
+
+	def read_range(self, filename, seek_to=0, amount=-1):
+		cached_file = get_decompressed_member_cache().get(self.path, filename)
+		if not cached_file and self._is_zip:
+			if self._open_member and self._open_member[0] == filename and self._open_member[1].tell() <= seek_to:
+				#Going forwards from where we were, so we can just keep decompressing from there
+				member_file = self._open_member[1]
+				member_file.seek(seek_to)
+				return member_file.read(amount)
+			if not self._open_member or self._open_member[0] != filename:
+				self._close_open_member()
+				member_file = self._get_zip_file().open(filename, 'r')
+				self._open_member = (filename, member_file)
+				member_file.seek(seek_to)
+				return member_file.read(amount)
+			#Going backwards would mean decompressing from the start again, so this is now something worth keeping around decompressed
+			self._close_open_member()
+
+		if not cached_file:
+			cached_file = self._get_cached_member(filename)
+		if cached_file:
+			cached_file.seek(seek_to)
+			return cached_file.read(amount)
+		#Too big for the cache, oh well
+		return _read_range_from_chunks(self.iter_chunks(filename), seek_to, amount)
+
+	def _close_open_member(self):
+		if self._open_member:
+			self._open_member[1].close()
+			self._open_member = None
+
+	def close(self):
+		self._close_open_member()
+		if self._zip_file:
+			self._zip_file.close()
+			self._zip_file = None
@@ -84,18 +84,24 @@ def sectored_read(path, raw_header_size, raw_footer_size, data_size, seek_to=0,
 	end_sector = int(math.ceil(end / data_size))
 	end_offset_in_sector = int(end % data_size)
 
-	#Read remainder of the start sector first
-	result = read_file(path, seek_to=start, amount=data_size - start_offset_in_sector)
-
-	#Read any sectors between start and end
-	for i in range(0, number_of_sectors - 2):
-		this_sector_start = cooked_position_to_real(data_size * (start_sector + i + 1), raw_header_size, raw_footer_size, data_size)
-		result += read_file(path, seek_to=this_sector_start, amount=data_size)
-
-	#Read as much out of the end sector as needed
-	end_sector_start = cooked_position_to_real(data_size * end_sector, raw_header_size, raw_footer_size, data_size)
-	result += read_file(path, seek_to=end_sector_start, amount=end_offset_in_sector + 1)
-	return result
+	#Only open the file once for all the sectors, instead of once per sector
+	with open(path, 'rb') as f:
+		def read_at(offset, size):
+			f.seek(offset)
+			return f.read(size)
+
+		#Read remainder of the start sector first
+		result = [read_at(start, data_size - start_offset_in_sector)]
+
+		#Read any sectors between start and end
+		for i in range(0, number_of_sectors - 2):
+			this_sector_start = cooked_position_to_real(data_size * (start_sector + i + 1), raw_header_size, raw_footer_size, data_size)
+			result.append(read_at(this_sector_start, data_size))
+
+		#Read as much out of the end sector as needed
+		end_sector_start = cooked_position_to_real(data_size * end_sector, raw_header_size, raw_footer_size, data_size)
+		result.append(read_at(end_sector_start, end_offset_in_sector + 1))
+	return b''.join(result)
 
 def cooked_position_to_real(cooked_position, raw_header_size, raw_footer_size, cooked_sector_size):
 	sector_count = cooked_position // cooked_sector_size
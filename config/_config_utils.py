@@ -29,9 +29,10 @@ def parse_value(section, name, value_type, default_value):
 		return default_value
 
 class ConfigValue():
-	def __init__(self, section, value_type, default_value, name, description):
+	def __init__(self, section, value_type, default_value, name, description, choices=None):
 		self.section = section
 		self.type = value_type
 		self.default_value = default_value
 		self.name = name #This is for humans to read!
 		self.description = description
+		self.choices = choices #If this is set, the value has to be one of these
@@ -2,7 +2,7 @@ import configparser
 import os
 import sys
 
-from common_paths import config_dir, data_dir
+from common_paths import cache_dir, config_dir, data_dir
 from common_types import ConfigValueType
 from io_utils import ensure_exist
 
@@ -35,7 +35,9 @@ runtime_option_section = '<runtime option section>'
 _config_ini_values = {
 	'output_folder': ConfigValue('Paths', ConfigValueType.FolderPath, os.path.join(data_dir, 'apps'), 'Output folder', 'Folder to put launchers'),
 	'organized_output_folder': ConfigValue('Paths', ConfigValueType.FolderPath, os.path.join(data_dir, 'organized_apps'), 'Organized output folder', 'Folder to put subfolders in for the organized folders frontend'),
+	'organized_folder_links': ConfigValue('Paths', ConfigValueType.String, 'copy', 'Organized folder links', 'How to put launchers into the organized output folder: copy, hardlink (falls back to copying if that doesn\'t work), or symlink', choices=('copy', 'hardlink', 'symlink')),
 	'image_folder': ConfigValue('Paths', ConfigValueType.FolderPath, os.path.join(data_dir, 'images'), 'Image folder', 'Folder to store images extracted from games with embedded images'),
+	'extraction_cache_folder': ConfigValue('Paths', ConfigValueType.FolderPath, os.path.join(cache_dir, 'extracted'), 'Extraction cache folder', 'Folder to extract compressed ROMs into when launching them with emulators that don\'t support that kind of compression'),
 
 	'get_series_from_name': ConfigValue('General', ConfigValueType.Bool, False, 'Get series from name', 'Attempt to get series from parsing name'),
 	'use_other_images_as_icons': ConfigValue('General', ConfigValueType.StringList, [], 'Use other images as icons', 'If there is no icon, use these images as icons if they are there'),
@@ -47,6 +49,7 @@ _config_ini_values = {
 	'exclude_system_drivers': ConfigValue('Arcade', ConfigValueType.Bool, False, 'Exclude system drivers', 'Skip machines used to launch other software (computers, consoles, etc)'),
 	'exclude_non_working': ConfigValue('Arcade', ConfigValueType.Bool, False, 'Exclude non-working', 'Skip any driver marked as not working'),
 	'non_working_whitelist': ConfigValue('Arcade', ConfigValueType.StringList, [], 'Non-working whitelist', 'If exclude_non_working is True, allow these machines anyway even if they are marked as not working'),
+	'use_romset_verify_cache': ConfigValue('Arcade', ConfigValueType.Bool, True, 'Use romset verify cache', 'Remember which romsets -verifyroms said were good or bad between runs, and only verify them again if the files for them (or their parents, BIOSes or devices) have changed'),
 
 	#TODO: Put this in a general section, use it in the other modules
 	'normalize_name_case': ConfigValue('Steam', ConfigValueType.Integer, 0, 'Normalize name case', 'Apply title case to uppercase things (1: only if whole title is uppercase, 2: capitalize individual uppercase words, 3: title case the whole thing regardless)'),
@@ -59,6 +62,11 @@ _config_ini_values = {
 	'find_software_by_name': ConfigValue('Roms', ConfigValueType.StringList, [], 'Systems to find software by name', 'For these platforms, use the filename to match something in the software list'), #TODO This should be a global option for each system
 	'find_software_by_product_code': ConfigValue('Roms', ConfigValueType.StringList, [], 'Systems to find software by serial', 'For these platforms, use the product code/serial to match something in the software list'), #TODO This should be a global option for each system
 	'max_size_for_storing_in_memory': ConfigValue('Roms', ConfigValueType.Integer, 32 * 1024 * 1024, 'Max size for storing in memory', 'Size in bytes, any ROM smaller than this will have the whole thing stored in memory for speedup'),
+	'jobs': ConfigValue('Roms', ConfigValueType.Integer, 1, 'Jobs', 'Number of processes to scan ROMs and MAME machines with at once (1 scans everything one at a time)'),
+	'use_hash_cache': ConfigValue('Roms', ConfigValueType.Bool, True, 'Use hash cache', 'Remember CRC32/MD5/SHA1 of ROMs between runs, so files that haven\'t changed don\'t need to be read again'),
+	'decompressed_member_cache_size': ConfigValue('Roms', ConfigValueType.Integer, 4 * 1024 * 1024 * 1024, 'Decompressed member cache size', 'Size in bytes; how much space in the temporary folder can be used to keep decompressed copies of files inside archives while scanning, so reading bits and pieces of a big zipped disc image over and over only decompresses it once (this is split between jobs)'),
+	'extraction_cache_size': ConfigValue('Roms', ConfigValueType.Integer, 8 * 1024 * 1024 * 1024, 'Extraction cache size', 'Size in bytes; when launching something extracts a ROM into the extraction cache folder and that makes it bigger than this, ROMs that were launched the longest time ago get deleted from it'),
+	'skip_unchanged_folders': ConfigValue('Roms', ConfigValueType.Bool, False, 'Skip unchanged folders', 'When not doing a full rescan, don\'t look inside folders where nothing has been added, removed or renamed since last time (launchers that were deleted by hand from those folders won\'t come back until a full rescan)'),
 	'libretro_database_path': ConfigValue('Roms', ConfigValueType.FolderPath, None, 'libretro-database path', 'Path to libretro database for yoinking metadata from'),
 
 	'use_original_platform': ConfigValue('ScummVM', ConfigValueType.Bool, False, 'Use original platform', 'Set the platform in metadata to the original platform instead of leaving blank'),
@@ -120,6 +128,8 @@ def get_command_line_arguments():
 					d[name] = parse_path_list(value)
 				elif option.type == ConfigValueType.StringList:
 					d[name] = parse_string_list(value)
+				elif option.type == ConfigValueType.Integer:
+					d[name] = int(value)
 				else:
 					d[name] = value
 	return d
@@ -191,6 +201,16 @@ class Config():
 			self.parser.read(_main_config_path)
 
 			self.ignored_directories = load_ignored_directories()
+			self.check_choices()
+
+		def check_choices(self):
+			#Otherwise a typo would just quietly end up doing whatever the code does when none of the choices match
+			for name, config in _config_ini_values.items():
+				if config.choices is None:
+					continue
+				value = getattr(self, name)
+				if value not in config.choices:
+					raise ValueError('{0} should be one of {1}, not {2!r}'.format(name, ', '.join(config.choices), value))
 
 		def rewrite_config(self):
 			with open(_main_config_path, 'wt') as f:
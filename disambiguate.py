@@ -1,7 +1,5 @@
 #!/usr/bin/env python3
 
-import configparser
-import os
 import itertools
 import collections
 import sys
@@ -38,9 +36,7 @@ def update_name(desktop, disambiguator, disambiguation_method):
 		disambiguity_section['Disambiguation-Method'] += ';' + disambiguation_method
 
 	desktop_entry['Name'] += ' ' + disambiguator
-
-	with open(desktop[0], 'wt') as f:
-		desktop[1].write(f)
+	#Gets written out later by launchers.save_launcher_store
 
 def resolve_duplicates_by_metadata(group, field, format_function=None, ignore_missing_values=False, field_section=launchers.metadata_section_name):
 	value_counter = collections.Counter(launchers.get_field(d[1], field, field_section) for d in group)
@@ -171,29 +167,70 @@ def resolve_duplicates(group, method, format_function=None, ignore_missing_value
 	else:
 		resolve_duplicates_by_metadata(group, method, format_function, ignore_missing_values, field_section)
 
-def fix_duplicate_names(method, format_function=None, ignore_missing_values=None, field_section=launchers.metadata_section_name):
-	files = [(path, launchers.get_desktop(path)) for path in [f.path for f in os.scandir(main_config.output_folder)]]
+class NameGroups():
+	#Launchers grouped by normalized name, which is worked out once up front and then only again for launchers whose name has since been changed by update_name, instead of sorting everything by name again for every single fix_duplicate_names
+	def __init__(self, files):
+		self.files = files
+		self._order = {path: i for i, (path, _) in enumerate(files)}
+		self._normalized_names = {}
+		self._keys = {}
+		self._groups = {}
+		for file in files:
+			self._add(file)
+
+	def _get_key(self, file):
+		name = launchers.get_field(file[1], 'Name', 'Desktop Entry')
+		if name not in self._normalized_names:
+			self._normalized_names[name] = normalize_name(name, care_about_numerals=True)
+		return self._normalized_names[name]
+
+	def _add(self, file):
+		key = self._get_key(file)
+		self._keys[file[0]] = key
+		group = self._groups.setdefault(key, [])
+		#Keep each group in the same order as the launchers themselves, as that's what order they'd be in if everything was sorted by name
+		position = len(group)
+		while position > 0 and self._order[group[position - 1][0]] > self._order[file[0]]:
+			position -= 1
+		group.insert(position, file)
+
+	def _remove(self, file):
+		key = self._keys.pop(file[0])
+		group = self._groups[key]
+		group[:] = [other for other in group if other[0] != file[0]]
+		if not group:
+			del self._groups[key]
+
+	def update(self, files):
+		#Call this after anything in files might have been renamed
+		for file in files:
+			if self._get_key(file) != self._keys[file[0]]:
+				self._remove(file)
+				self._add(file)
+
+	def get_duplicates(self):
+		return [(key, list(self._groups[key])) for key in sorted(key for key, group in self._groups.items() if len(group) > 1)]
+
+def fix_duplicate_names(method, format_function=None, ignore_missing_values=None, field_section=launchers.metadata_section_name, name_groups=None):
+	if name_groups is None:
+		name_groups = NameGroups(list(launchers.get_launcher_store()))
 	if method == 'dev-status':
-		resolve_duplicates_by_dev_status(files)
+		resolve_duplicates_by_dev_status(name_groups.files)
+		name_groups.update(name_groups.files)
 		return
 
 	if method == 'check':
 		keyfunc = lambda f: launchers.get_field(f[1], 'Name', 'Desktop Entry').lower()
-	else:
-		#Why did I call the variable "f"? Oh well
-		keyfunc = lambda f: normalize_name(launchers.get_field(f[1], 'Name', 'Desktop Entry'), care_about_numerals=True)
-	files.sort(key=keyfunc)
-	duplicates = {}
-	for key, group in itertools.groupby(files, key=keyfunc):
-		g = list(group)
-		if len(g) > 1:
-			duplicates[key] = g
-
-	for k, v in duplicates.items():
-		if method == 'check':
-			print('Duplicate name still remains: ', k, [(d[1][launchers.junk_section_name].get('Original-Name', '<no Original-Name>') if launchers.junk_section_name in d[1] else '<no junk section>') for d in v])
-		else:
-			resolve_duplicates(v, method, format_function, ignore_missing_values, field_section)
+		files = sorted(name_groups.files, key=keyfunc)
+		for key, group in itertools.groupby(files, key=keyfunc):
+			g = list(group)
+			if len(g) > 1:
+				print('Duplicate name still remains: ', key, [(d[1][launchers.junk_section_name].get('Original-Name', '<no Original-Name>') if launchers.junk_section_name in d[1] else '<no junk section>') for d in g])
+		return
+
+	for _, group in name_groups.get_duplicates():
+		resolve_duplicates(group, method, format_function, ignore_missing_values, field_section)
+		name_groups.update(group)
 
 def revision_disambiguate(rev, _):
 	if rev == '0':
@@ -212,11 +249,7 @@ def arcade_system_disambiguate(arcade_system, name):
 
 def reambiguate():
 	#This seems counter-intuitive, but if we're not doing a full rescan, we want to do this before disambiguating again or else it gets weird
-	output_folder = main_config.output_folder
-	for file in os.scandir(output_folder):
-		desktop = configparser.ConfigParser(interpolation=None)
-		desktop.optionxform = str
-		desktop.read(file.path)
+	for _, desktop in launchers.get_launcher_store():
 		desktop_entry = desktop['Desktop Entry']
 		if disambiguity_section_name not in desktop:
 			#If name wasn't ambiguous to begin with, we don't need to worry about it
@@ -232,34 +265,33 @@ def reambiguate():
 			del disambiguity_section['Ambiguous-Name']
 		del desktop[disambiguity_section_name]
 
-		with open(file.path, 'wt') as f:
-			desktop.write(f)
-
 def disambiguate_names():
 	time_started = time.perf_counter()
 
 	if not main_config.full_rescan:
 		reambiguate()
 
-	fix_duplicate_names('Platform')
-	fix_duplicate_names('Type', field_section=launchers.id_section_name)
-	fix_duplicate_names('dev-status')
-	fix_duplicate_names('Arcade-System', arcade_system_disambiguate)
-	fix_duplicate_names('Media-Type', ignore_missing_values=True)
-	fix_duplicate_names('Is-Colour', lambda is_colour, _: None if is_colour in (False, 'No') else '(Colour)')
-	fix_duplicate_names('Regions', lambda regions, _: '({0})'.format(regions.replace(';', ', ')), ignore_missing_values=True)
-	fix_duplicate_names('Region-Code')
-	fix_duplicate_names('TV-Type', ignore_missing_values=True)
-	fix_duplicate_names('Version')
-	fix_duplicate_names('Revision', revision_disambiguate)
-	fix_duplicate_names('Languages', lambda languages, _: '({0})'.format(languages.replace(';', ', ')), ignore_missing_values=True)
-	#fix_duplicate_names('date', ignore_missing_values=True)
-	fix_duplicate_names('Publisher', ignore_missing_values=True)
-	fix_duplicate_names('Developer', ignore_missing_values=True)
-	fix_duplicate_names('tags')
-	fix_duplicate_names('Extension', '(.{0})'.format, ignore_missing_values=True)
+	#All of this just changes things in the launcher store, which only gets written once at the end, so each launcher is written at most once no matter how many disambiguators it ends up with
+	name_groups = NameGroups(list(launchers.get_launcher_store()))
+	fix_duplicate_names('Platform', name_groups=name_groups)
+	fix_duplicate_names('Type', field_section=launchers.id_section_name, name_groups=name_groups)
+	fix_duplicate_names('dev-status', name_groups=name_groups)
+	fix_duplicate_names('Arcade-System', arcade_system_disambiguate, name_groups=name_groups)
+	fix_duplicate_names('Media-Type', ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('Is-Colour', lambda is_colour, _: None if is_colour in (False, 'No') else '(Colour)', name_groups=name_groups)
+	fix_duplicate_names('Regions', lambda regions, _: '({0})'.format(regions.replace(';', ', ')), ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('Region-Code', name_groups=name_groups)
+	fix_duplicate_names('TV-Type', ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('Version', name_groups=name_groups)
+	fix_duplicate_names('Revision', revision_disambiguate, name_groups=name_groups)
+	fix_duplicate_names('Languages', lambda languages, _: '({0})'.format(languages.replace(';', ', ')), ignore_missing_values=True, name_groups=name_groups)
+	#fix_duplicate_names('date', ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('Publisher', ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('Developer', ignore_missing_values=True, name_groups=name_groups)
+	fix_duplicate_names('tags', name_groups=name_groups)
+	fix_duplicate_names('Extension', '(.{0})'.format, ignore_missing_values=True, name_groups=name_groups)
 	if main_config.debug:
-		fix_duplicate_names('check')
+		fix_duplicate_names('check', name_groups=name_groups)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -267,3 +299,4 @@ def disambiguate_names():
 
 if __name__ == '__main__':
 	disambiguate_names()
+	launchers.save_launcher_store()
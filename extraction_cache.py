@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from config.main_config import main_config
+
+#When an emulator doesn't support the compression a ROM is in, the launcher runs this first to get it extracted, and then points the emulator at the extracted copy in here
+#That used to get extracted into a temp folder and deleted afterwards every time, which takes ages with big disc images, so now the extracted copy stays around until the cache gets bigger than extraction_cache_size, and then whatever was launched the longest time ago gets deleted
+
+#These start with a dot so they don't get mistaken for anything that's been extracted
+_info_filename = '.meow-extraction-info.json'
+_lock_filename = '.lock'
+_temp_folder_suffix = '.tmp'
+
+class ExtractionFolderInUseException(Exception):
+	pass
+
+def get_in_use_lock_path(folder):
+	#Whatever's running from folder has a shared lock on this the whole time, so nothing deletes it out from under them
+	#It's next to the folder and not in it, because the folder gets replaced when it's extracted again
+	cache_folder, name = os.path.split(folder)
+	return os.path.join(cache_folder, '.' + name + '.lock')
+
+def get_extraction_folder(archive_path, name):
+	#This has to be known when the launcher is made, so it's just based on where the archive is, and name is just there so you can tell what's what when looking in the folder
+	path_hash = hashlib.sha1(os.path.abspath(archive_path).encode('utf-8', errors='surrogateescape')).hexdigest()[:16]
+	return os.path.join(main_config.extraction_cache_folder, name + '-' + path_hash)
+
+def get_folder_size(folder):
+	size = 0
+	for root, _, files in os.walk(folder):
+		for filename in files:
+			try:
+				size += os.lstat(os.path.join(root, filename)).st_size
+			except OSError:
+				pass
+	return size
+
+def _read_info(folder):
+	try:
+		with open(os.path.join(folder, _info_filename), 'rt', encoding='utf-8') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def is_up_to_date(folder, archive_stat):
+	info = _read_info(folder)
+	if not info:
+		return False
+	return info.get('size') == archive_stat.st_size and info.get('mtime') == archive_stat.st_mtime_ns
+
+def extract(archive_path, folder, archive_stat):
+	#Extract somewhere else first and then move it into place, so if 7z fails or gets killed halfway through, we don't end up with half a ROM that looks like it's fine next time
+	temp_folder = tempfile.mkdtemp(prefix='.', suffix=_temp_folder_suffix, dir=os.path.dirname(folder))
+	try:
+		subprocess.run(['7z', 'x', '-o' + temp_folder, archive_path], check=True)
+		info = {'size': archive_stat.st_size, 'mtime': archive_stat.st_mtime_ns, 'extracted_size': get_folder_size(temp_folder)}
+		with open(os.path.join(temp_folder, _info_filename), 'wt', encoding='utf-8') as f:
+			json.dump(info, f)
+		shutil.rmtree(folder, ignore_errors=True)
+		os.rename(temp_folder, folder)
+	except BaseException:
+		shutil.rmtree(temp_folder, ignore_errors=True)
+		raise
+
+def evict(cache_folder, folder_to_keep, budget):
+	entries = []
+	for entry in os.scandir(cache_folder):
+		if not entry.is_dir(follow_symlinks=False):
+			continue
+		if entry.name.startswith('.'):
+			if entry.name.endswith(_temp_folder_suffix):
+				#Extracting only happens while the main lock is held, which it is now, so this must be left over from 7z getting killed or something like that
+				shutil.rmtree(entry.path, ignore_errors=True)
+			continue
+		info = _read_info(entry.path)
+		try:
+			last_used = os.stat(os.path.join(entry.path, _info_filename)).st_mtime_ns
+		except OSError:
+			#Leftover from something that went wrong, so get rid of it first
+			last_used = 0
+		extracted_size = info.get('extracted_size') if info else None
+		if extracted_size is None:
+			extracted_size = get_folder_size(entry.path)
+		entries.append((last_used, extracted_size, entry.path))
+
+	total_size = sum(size for _, size, _ in entries)
+	for _, size, path in sorted(entries):
+		if total_size <= budget:
+			break
+		if path == folder_to_keep:
+			#Even if this one on its own is bigger than the budget, we're about to launch it, so we do need it
+			continue
+		lock_path = get_in_use_lock_path(path)
+		with open(lock_path, 'wb') as in_use_lock:
+			try:
+				fcntl.flock(in_use_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except BlockingIOError:
+				#Something launched earlier is still running from here
+				continue
+			if main_config.debug:
+				print('Removing', path, 'from extraction cache')
+			shutil.rmtree(path, ignore_errors=True)
+			os.remove(lock_path)
+		total_size -= size
+
+def get_extracted(archive_path, folder, budget):
+	#Returns the in-use lock for folder (already locked), which whoever is going to use what's in there should keep open until they're done
+	cache_folder = os.path.dirname(folder)
+	os.makedirs(cache_folder, exist_ok=True)
+	archive_stat = os.stat(archive_path)
+
+	#If two things are launched at once, don't have them both extracting into or deleting from the same place
+	with open(os.path.join(cache_folder, _lock_filename), 'wb') as lock_file:
+		fcntl.flock(lock_file, fcntl.LOCK_EX)
+		in_use_lock = open(get_in_use_lock_path(folder), 'wb')
+		try:
+			#Nothing else can be evicting or extracting while we have the main lock, so none of this will have to wait
+			if is_up_to_date(folder, archive_stat):
+				fcntl.flock(in_use_lock, fcntl.LOCK_SH)
+				#This is how we know what was used most recently
+				os.utime(os.path.join(folder, _info_filename))
+			else:
+				try:
+					#Extracting it again means deleting what's there now, so make sure nothing is still running from there first
+					fcntl.flock(in_use_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+				except BlockingIOError:
+					if _read_info(folder) is None:
+						raise ExtractionFolderInUseException('{0} is being used by something else, but has nothing extracted in it'.format(folder))
+					print(archive_path, 'has changed since it was extracted, but the old extracted copy is still being used by something else, so using that one for now')
+					fcntl.flock(in_use_lock, fcntl.LOCK_SH)
+					os.utime(os.path.join(folder, _info_filename))
+				else:
+					extract(archive_path, folder, archive_stat)
+					fcntl.flock(in_use_lock, fcntl.LOCK_SH)
+			evict(cache_folder, folder, budget)
+		except BaseException:
+			in_use_lock.close()
+			raise
+	return in_use_lock
+
+def main():
+	if len(sys.argv) < 3:
+		print('Usage:', sys.argv[0], 'archive_path extraction_folder [command...]')
+		sys.exit(1)
+	in_use_lock = get_extracted(sys.argv[1], sys.argv[2], main_config.extraction_cache_size)
+	command = sys.argv[3:]
+	if not command:
+		#Launchers made before the command was passed in here just extract it and then run the emulator themselves
+		return
+	with in_use_lock:
+		#The emulator gets the lock too, so it's still held if we get killed and it doesn't
+		proc = subprocess.run(command, pass_fds=(in_use_lock.fileno(), ), check=False)
+	sys.exit(proc.returncode)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+from common_paths import cache_dir
+from config.main_config import main_config
+
+#Remembers CRC32/MD5/SHA1 (and byteswapped CRC32 for N64) of ROMs between runs, so we don't have to read through gigabytes of disc images again just to find out what we already knew last time
+#Entries are only trusted if the file on disk (i.e. the archive, for things inside archives) still has the same size and mtime as it did when the hash was stored
+
+hash_cache_path = os.path.join(cache_dir, 'hashes.db')
+#chd_sha1 is the SHA1 of the uncompressed data stored inside the header of a .chd, which is not the same as the SHA1 of the .chd file itself
+hash_types = {'crc32': 'INTEGER', 'md5': 'TEXT', 'sha1': 'TEXT', 'byteswapped_crc32': 'INTEGER', 'chd_sha1': 'TEXT'} #name -> column type
+
+class HashCache():
+	def __init__(self, path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		#Each scan worker process has its own connection, so let them wait on each other rather than erroring out
+		self.connection = sqlite3.connect(path, timeout=60)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute('''CREATE TABLE IF NOT EXISTS hashes (
+			path TEXT NOT NULL,
+			compressed_entry TEXT NOT NULL,
+			header_length INTEGER NOT NULL,
+			size INTEGER NOT NULL,
+			mtime INTEGER NOT NULL,
+			crc32 INTEGER,
+			md5 TEXT,
+			sha1 TEXT,
+			byteswapped_crc32 INTEGER,
+			chd_sha1 TEXT,
+			PRIMARY KEY (path, compressed_entry, header_length)
+		)''')
+		#Hash caches from before a hash type was added won't have a column for it yet
+		columns = {row[1] for row in self.connection.execute('PRAGMA table_info(hashes)')}
+		for hash_type, column_type in hash_types.items():
+			if hash_type not in columns:
+				self.connection.execute('ALTER TABLE hashes ADD COLUMN {0} {1}'.format(hash_type, column_type))
+		self.connection.commit()
+
+	def get(self, path, compressed_entry, header_length, hash_type, stat):
+		row = self.connection.execute('SELECT size, mtime, {0} FROM hashes WHERE path = ? AND compressed_entry = ? AND header_length = ?'.format(hash_type), (path, compressed_entry or '', header_length)).fetchone()
+		if not row:
+			return None
+		size, mtime, value = row
+		if size != stat.st_size or mtime != stat.st_mtime_ns:
+			return None
+		return value
+
+	def put(self, path, compressed_entry, header_length, hash_type, stat, value):
+		key = (path, compressed_entry or '', header_length)
+		row = self.connection.execute('SELECT size, mtime FROM hashes WHERE path = ? AND compressed_entry = ? AND header_length = ?', key).fetchone()
+		if row and row == (stat.st_size, stat.st_mtime_ns):
+			self.connection.execute('UPDATE hashes SET {0} = ? WHERE path = ? AND compressed_entry = ? AND header_length = ?'.format(hash_type), (value, ) + key)
+		else:
+			#Either it's new or the file changed, in which case whatever other hashes were stored for it are useless now
+			self.connection.execute('INSERT OR REPLACE INTO hashes (path, compressed_entry, header_length, size, mtime, {0}) VALUES (?, ?, ?, ?, ?, ?)'.format(hash_type), key + (stat.st_size, stat.st_mtime_ns, value))
+		self.connection.commit()
+
+	def prune(self):
+		stale = []
+		for path, size, mtime in self.connection.execute('SELECT DISTINCT path, size, mtime FROM hashes'):
+			try:
+				stat = os.stat(path)
+			except OSError:
+				stale.append(path)
+				continue
+			if size != stat.st_size or mtime != stat.st_mtime_ns:
+				stale.append(path)
+
+		self.connection.executemany('DELETE FROM hashes WHERE path = ?', [(path, ) for path in stale])
+		self.connection.commit()
+		self.connection.execute('VACUUM')
+		return len(stale)
+
+_hash_cache = None
+_hash_cache_pid = None
+def get_hash_cache():
+	global _hash_cache, _hash_cache_pid
+	#sqlite3 connections can't be shared with forked processes, so make a new one if we've ended up in a worker
+	if _hash_cache is None or _hash_cache_pid != os.getpid():
+		_hash_cache = HashCache(hash_cache_path)
+		_hash_cache_pid = os.getpid()
+	return _hash_cache
+
+def get_cached_hash(path, compressed_entry, header_length, hash_type):
+	if not main_config.use_hash_cache:
+		return None
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	return get_hash_cache().get(path, compressed_entry, header_length, hash_type, stat)
+
+def store_hash(path, compressed_entry, header_length, hash_type, value):
+	if not main_config.use_hash_cache or value is None:
+		return
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return
+	get_hash_cache().put(path, compressed_entry, header_length, hash_type, stat, value)
+
+def get_hash(path, compressed_entry, header_length, hash_type, compute_function):
+	value = get_cached_hash(path, compressed_entry, header_length, hash_type)
+	if value is None:
+		value = compute_function()
+		store_hash(path, compressed_entry, header_length, hash_type, value)
+	return value
+
+def main():
+	if '--prune' in sys.argv:
+		time_started = time.perf_counter()
+		removed = get_hash_cache().prune()
+		print('Removed', removed, 'files which no longer exist or have changed from the hash cache')
+		if main_config.print_times:
+			time_ended = time.perf_counter()
+			print('Hash cache pruning finished in', str(datetime.timedelta(seconds=time_ended - time_started)))
+	else:
+		print('Usage: hash_cache.py --prune')
+
+if __name__ == '__main__':
+	main()
@@ -2,7 +2,8 @@ import os
 
 from common_types import EmulationNotSupportedException, EmulationStatus
 from launchers import LaunchParams
-from mame_helpers import have_mame, verify_romset
+from mame_helpers import have_mame
+from romset_verify_cache import verify_romset
 from software_list_info import get_software_list_by_name
 
 def _get_autoboot_script_by_name(name):
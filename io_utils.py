@@ -25,16 +25,7 @@ def read_file(path, compressed_entry=None, seek_to=0, amount=-1):
 
 			return f.read(amount)
 
-	data = archives.compressed_get(path, compressed_entry)
-	if seek_to:
-		if amount > -1:
-			return data[seek_to: seek_to + amount]
-		return data[seek_to:]
-
-	if amount > -1:
-		return data[:amount]
-
-	return data
+	return archives.compressed_read_range(path, compressed_entry, seek_to, amount)
 
 def get_crc32(path, compressed_entry=None):
 	if not compressed_entry:
@@ -46,6 +37,10 @@ def get_crc32(path, compressed_entry=None):
 
 	return archives.get_crc32_of_archive(path, compressed_entry)
 
+def iter_chunks(path, chunk_size=crc_chunk_size):
+	with open(path, 'rb') as f:
+		yield from iter(lambda: f.read(chunk_size), b'')
+
 def sanitize_name(s, supersafe=False):
 	#These must never be filenames or folder names!  Badbadbad!
 	if not s:
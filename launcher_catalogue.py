@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import sys
+
+from common import normalize_name
+from config.main_config import main_config
+
+#Everything that's in the .desktop files in the output folder, in one SQLite database in that same folder, so anything that wants to know about all the launchers (including our own post-processing stuff) can just look here instead of parsing thousands of files
+#Each row remembers the size and mtime of the file it came from, so if something else has changed a launcher, we can tell the row is out of date and read the file instead
+
+#Starts with a dot so it doesn't get mistaken for a launcher (and desktop environments ignore it)
+catalogue_filename = '.meow-launcher-catalogue.db'
+
+def is_catalogue_or_temp_file(filename):
+	return filename.startswith('.')
+
+class LauncherCatalogue():
+	def __init__(self, folder):
+		self.folder = folder
+		os.makedirs(folder, exist_ok=True)
+		self.connection = sqlite3.connect(os.path.join(folder, catalogue_filename), timeout=60)
+		self.connection.execute('''CREATE TABLE IF NOT EXISTS launchers (
+			filename TEXT PRIMARY KEY,
+			size INTEGER NOT NULL,
+			mtime INTEGER NOT NULL,
+			type TEXT,
+			unique_id TEXT,
+			name TEXT,
+			normalized_name TEXT,
+			platform TEXT,
+			exec TEXT,
+			sections TEXT NOT NULL
+		)''')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS launchers_id ON launchers (type, unique_id)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS launchers_platform ON launchers (platform)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS launchers_normalized_name ON launchers (normalized_name)')
+		self.connection.commit()
+
+	def put(self, filename, sections, stat):
+		desktop_entry = sections.get('Desktop Entry', {})
+		id_section = sections.get('X-Meow Launcher ID', {})
+		name = desktop_entry.get('Name')
+		self.connection.execute('INSERT OR REPLACE INTO launchers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+			filename, stat.st_size, stat.st_mtime_ns,
+			id_section.get('Type'), id_section.get('Unique-ID'),
+			name, normalize_name(name, care_about_numerals=True) if name else None,
+			sections.get('X-Meow Launcher Metadata', {}).get('Platform'),
+			desktop_entry.get('Exec'),
+			json.dumps(sections)
+		))
+
+	def delete(self, filename):
+		self.connection.execute('DELETE FROM launchers WHERE filename = ?', (filename, ))
+
+	def commit(self):
+		self.connection.commit()
+
+	def close(self):
+		self.connection.commit()
+		self.connection.close()
+
+	def get_rows(self, columns='size, mtime, type, unique_id'):
+		#filename -> (the rest of the columns)
+		return {row[0]: row[1:] for row in self.connection.execute('SELECT filename, {0} FROM launchers'.format(columns))}
+
+	def find(self, game_type=None, unique_id=None, platform=None, name=None):
+		#Returns [(filename, sections)]; note that this doesn't check if the files have been changed by something else since they were last seen
+		conditions = []
+		args = []
+		if game_type is not None:
+			conditions.append('type = ?')
+			args.append(game_type)
+		if unique_id is not None:
+			conditions.append('unique_id = ?')
+			args.append(unique_id)
+		if platform is not None:
+			conditions.append('platform = ?')
+			args.append(platform)
+		if name is not None:
+			conditions.append('normalized_name = ?')
+			args.append(normalize_name(name, care_about_numerals=True))
+		query = 'SELECT filename, sections FROM launchers'
+		if conditions:
+			query += ' WHERE ' + ' AND '.join(conditions)
+		return [(filename, json.loads(sections)) for filename, sections in self.connection.execute(query + ' ORDER BY filename', args)]
+
+_catalogues = {}
+def get_catalogue(folder):
+	#sqlite3 connections can't be shared with forked processes, so each process gets its own
+	key = (folder, os.getpid())
+	if key not in _catalogues:
+		_catalogues[key] = LauncherCatalogue(folder)
+	return _catalogues[key]
+
+def close_catalogues():
+	for key, catalogue in list(_catalogues.items()):
+		if key[1] == os.getpid():
+			catalogue.close()
+		del _catalogues[key]
+
+def main():
+	args = {}
+	for arg in sys.argv[1:]:
+		for name in ('type', 'id', 'platform', 'name'):
+			if arg.startswith('--{0}='.format(name)):
+				args[name] = arg.partition('=')[2]
+
+	catalogue = get_catalogue(main_config.output_folder)
+	for filename, sections in catalogue.find(args.get('type'), args.get('id'), args.get('platform'), args.get('name')):
+		print(filename, sections.get('Desktop Entry', {}).get('Name'), sep='\t')
+
+if __name__ == '__main__':
+	main()
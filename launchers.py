@@ -1,13 +1,19 @@
+import atexit
+import collections
+import concurrent.futures
 import configparser
+import json
 import os
 import pathlib
 import re
 import shlex
+import tempfile
+import threading
 from enum import Enum
 
 import common
+import launcher_catalogue
 from config.main_config import main_config
-from io_utils import ensure_exist
 
 try:
 	from PIL import Image
@@ -29,6 +35,210 @@ def get_desktop(path):
 	parser.read(path)
 	return parser
 
+class LauncherDesktop(dict):
+	#Just the sections and their values out of a .desktop file, as plain dicts, so the post-processing passes can look at and change them with the same get_field/desktop[section] stuff that works on a ConfigParser
+	def add_section(self, section):
+		self[section] = {}
+
+	def freeze(self):
+		return tuple((section_name, tuple(section.items())) for section_name, section in self.items())
+
+	def write(self, f):
+		f.write(format_desktop(self))
+
+def _load_launcher_desktop(path):
+	desktop = LauncherDesktop()
+	parser = get_desktop(path)
+	for section_name in parser.sections():
+		desktop[section_name] = dict(parser[section_name])
+	return desktop
+
+class LauncherStore():
+	#Every launcher in the output folder, read once and kept around so remove_nonexistent_games, series_detect, disambiguate and organize_folders don't all have to go through the whole output folder again (several times, in some cases)
+	#Nothing gets written until save(), and then only for launchers that actually changed
+	def __init__(self, folder):
+		self.folder = folder
+		self._launchers = {} #path -> LauncherDesktop
+		self._originals = {} #path -> LauncherDesktop.freeze() as of when it was last read/written
+		self._removed = set()
+		self._written = [] #Paths that make_linux_desktop has written (or is still writing) since we last looked
+		if os.path.isdir(folder):
+			catalogue = launcher_catalogue.get_catalogue(folder)
+			catalogued = catalogue.get_rows('size, mtime, sections')
+			#Keep it in the same order as listing the folder would be, as disambiguation can depend on what order things are in
+			for entry in os.scandir(folder):
+				if launcher_catalogue.is_catalogue_or_temp_file(entry.name):
+					continue
+				stat = entry.stat()
+				row = catalogued.get(entry.name)
+				if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+					desktop = LauncherDesktop(json.loads(row[2]))
+					self._launchers[entry.path] = desktop
+					self._originals[entry.path] = desktop.freeze()
+				else:
+					#Not in the catalogue, or something else has changed it since then
+					self._add_from_disk(entry.path, stat)
+			for filename in catalogued.keys() - set(os.path.basename(path) for path in self._launchers):
+				catalogue.delete(filename)
+			catalogue.commit()
+
+	def _add_from_disk(self, path, stat=None):
+		desktop = _load_launcher_desktop(path)
+		self._launchers[path] = desktop
+		self._originals[path] = desktop.freeze()
+		if stat is None:
+			stat = os.stat(path)
+		folder, filename = os.path.split(path)
+		launcher_catalogue.get_catalogue(folder).put(filename, desktop, stat)
+
+	def __iter__(self):
+		#(path, desktop)
+		return iter(list(self._launchers.items()))
+
+	def __len__(self):
+		return len(self._launchers)
+
+	def get(self, path):
+		return self._launchers.get(path)
+
+	def add_from_disk(self, path):
+		#For something that was just written to the output folder
+		self._removed.discard(path)
+		self._add_from_disk(path)
+
+	def add_written(self, path):
+		#Waiting for each write to finish so it can be read back in would mean only writing one launcher at a time, so just remember it for later
+		self._written.append(path)
+
+	def add_written_from_disk(self):
+		#flush_desktop_writes needs to have been called first
+		for path in self._written:
+			self.add_from_disk(path)
+		self._written = []
+
+	def remove(self, path):
+		self._launchers.pop(path, None)
+		self._originals.pop(path, None)
+		self._removed.add(path)
+
+	def save(self):
+		for path in self._removed:
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			folder, filename = os.path.split(path)
+			_release_filename(folder, filename)
+			launcher_catalogue.get_catalogue(folder).delete(filename)
+		self._removed = set()
+
+		written = 0
+		for path, desktop in self._launchers.items():
+			frozen = desktop.freeze()
+			if frozen == self._originals[path]:
+				continue
+			contents = format_desktop(desktop)
+			stat = write_desktop_file(path, contents)
+			self._originals[path] = frozen
+			launcher_catalogue.get_catalogue(self.folder).put(os.path.basename(path), _get_sections_as_read_back(desktop, contents), stat)
+			written += 1
+		launcher_catalogue.get_catalogue(self.folder).commit()
+		return written
+
+_launcher_store = None
+def get_launcher_store():
+	global _launcher_store
+	flush_desktop_writes()
+	if _launcher_store is None:
+		_launcher_store = LauncherStore(main_config.output_folder)
+	else:
+		_launcher_store.add_written_from_disk()
+	return _launcher_store
+
+def save_launcher_store():
+	if _launcher_store is not None:
+		get_launcher_store().save()
+
+def discard_launcher_store():
+	#For when the output folder is about to be changed behind its back (starting a new run from the GUI, etc), so forget what we know about what filenames are in there too
+	global _launcher_store
+	_launcher_store = None
+	_filename_allocators.clear()
+	launcher_catalogue.close_catalogues()
+
+def format_desktop(sections):
+	#Does the same thing as ConfigParser.write (down to the byte), just without having to go through a ConfigParser to get there
+	lines = []
+	for section_name, section in sections.items():
+		lines.append('[' + section_name + ']\n')
+		for k, v in section.items():
+			lines.append(k + ' = ' + str(v).replace('\n', '\n\t') + '\n')
+		lines.append('\n')
+	return ''.join(lines)
+
+def write_desktop_file(path, contents):
+	#Write to a temporary file and move it into place, so nothing ever sees a half-written launcher
+	folder = os.path.dirname(path)
+	fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.', suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'wt') as f:
+			f.write(contents)
+		#Set executable, but also set everything else because whatever
+		os.chmod(temp_path, 0o7777)
+		os.replace(temp_path, path)
+	except BaseException:
+		os.unlink(temp_path)
+		raise
+	return os.stat(path)
+
+def _get_sections_as_read_back(sections, contents):
+	#What get_desktop would give us if we read this back, so what goes into the catalogue/launcher store is the same as if it was read from the file
+	#For the usual case, that's just stripping whitespace off the values, but for anything weirder let configparser sort it out
+	for section_name, section in sections.items():
+		if not section_name or '\n' in section_name or '\r' in section_name or ']' in section_name:
+			return _parse_desktop(contents)
+		for k, v in section.items():
+			if '\n' in v or '\r' in v or '=' in k or k != k.strip() or not k or k.startswith(('#', '[')):
+				return _parse_desktop(contents)
+	return {section_name: {k: v.strip() for k, v in section.items()} for section_name, section in sections.items()}
+
+def _parse_desktop(contents):
+	parser = configparser.ConfigParser(interpolation=None, delimiters=('='), comment_prefixes=('#'))
+	parser.optionxform = str
+	parser.read_string(contents)
+	return {section_name: dict(parser[section_name]) for section_name in parser.sections()}
+
+def _collect_desktop_write(path, future, sections):
+	stat = future.result()
+	folder, filename = os.path.split(path)
+	launcher_catalogue.get_catalogue(folder).put(filename, sections, stat)
+
+#Writing files is most of what's left once everything else about a launcher is worked out, so let a few threads do it while we get on with the next one
+_writer_threads = 4
+_max_pending_writes = 1024
+_writer_pool = None
+_pending_writes = collections.OrderedDict() #path -> (Future, sections as they would be read back)
+
+def _submit_desktop_write(path, sections, contents):
+	global _writer_pool
+	if _writer_pool is None:
+		_writer_pool = concurrent.futures.ThreadPoolExecutor(_writer_threads)
+		atexit.register(flush_desktop_writes)
+	_pending_writes[path] = (_writer_pool.submit(write_desktop_file, path, contents), _get_sections_as_read_back(sections, contents))
+	while len(_pending_writes) > _max_pending_writes:
+		pending_path, (future, pending_sections) = _pending_writes.popitem(last=False)
+		_collect_desktop_write(pending_path, future, pending_sections)
+
+def flush_desktop_writes():
+	#Anything that's going to look in the output folder needs to call this first
+	folders = set()
+	while _pending_writes:
+		path, (future, sections) = _pending_writes.popitem(last=False)
+		_collect_desktop_write(path, future, sections)
+		folders.add(os.path.dirname(path))
+	for folder in folders:
+		launcher_catalogue.get_catalogue(folder).commit()
+
 def get_field(desktop, name, section=metadata_section_name):
 	if section not in desktop:
 		return None
@@ -110,26 +320,58 @@ class MultiCommandLaunchParams():
 		new_commands = [command.replace_path_argument(path) for command in self.commands]
 		return MultiCommandLaunchParams(new_commands)
 
+class FilenameAllocator():
+	#Remembers what's in a folder so picking a filename doesn't mean checking if blah.desktop, blah2.desktop, blah3.desktop… exist one by one, which adds up with things that have hundreds of versions
+	#It gives out the same filenames as checking one by one would (the lowest number that's free), as long as nothing else is putting files in there behind its back
+	def __init__(self, folder):
+		self._lock = threading.Lock()
+		self._taken = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+		self._next_suffix = {} #(base filename, extension) -> lowest number that might still be free
+
+	def allocate(self, base_filename, extension):
+		with self._lock:
+			filename = base_filename + os.extsep + extension
+			if filename in self._taken:
+				i = self._next_suffix.get((base_filename, extension), 2)
+				filename = base_filename + str(i) + os.extsep + extension
+				while filename in self._taken:
+					i += 1
+					filename = base_filename + str(i) + os.extsep + extension
+				self._next_suffix[(base_filename, extension)] = i + 1
+			self._taken.add(filename)
+			return filename
+
+	def release(self, filename):
+		#Something got deleted, so it (or its number) can be given out again
+		with self._lock:
+			self._taken.discard(filename)
+			self._next_suffix.clear()
+
+_filename_allocators = {} #absolute path of folder -> FilenameAllocator
+def _get_filename_allocator(folder):
+	#output_folder could be relative or have a slash at the end, and paths that come back to us from elsewhere won't be, so they need to end up as the same key
+	folder = os.path.abspath(folder)
+	if folder not in _filename_allocators:
+		_filename_allocators[folder] = FilenameAllocator(folder)
+	return _filename_allocators[folder]
+
+def _release_filename(folder, filename):
+	folder = os.path.abspath(folder)
+	if folder in _filename_allocators:
+		_filename_allocators[folder].release(filename)
+
 def pick_new_filename(folder, display_name, extension):
 	base_filename = make_filename(display_name)
-	filename = base_filename + os.extsep + extension
-
-	i = 2
-	while os.path.isfile(os.path.join(folder, filename)):
-		filename = base_filename + str(i) + os.extsep + extension
-		i += 1
-	return filename
+	return _get_filename_allocator(folder).allocate(base_filename, extension)
 
+_created_output_folders = set()
 def make_linux_desktop(launch_params, display_name, fields=None):
 	filename = pick_new_filename(main_config.output_folder, display_name, 'desktop')
 	
 	path = os.path.join(main_config.output_folder, filename)
 
-	configwriter = configparser.ConfigParser(interpolation=None)
-	configwriter.optionxform = str
-
-	configwriter.add_section('Desktop Entry')
-	desktop_entry = configwriter['Desktop Entry']
+	sections = {}
+	desktop_entry = sections['Desktop Entry'] = {}
 
 	#Necessary for this thing to even be recognized
 	desktop_entry['Type'] = 'Application'
@@ -144,8 +386,7 @@ def make_linux_desktop(launch_params, display_name, fields=None):
 		for section_name, section in fields.items():
 			if not section:
 				continue
-			configwriter.add_section(section_name)
-			section_writer = configwriter[section_name]
+			section_writer = sections[section_name] = {}
 
 			for k, v in section.items():
 				if v is None:
@@ -175,19 +416,24 @@ def make_linux_desktop(launch_params, display_name, fields=None):
 				value_as_string = common.clean_string(value_as_string)
 				section_writer[k.replace('_', '-')] = value_as_string
 
-	if image_section_name in configwriter:
+	if image_section_name in sections:
 		keys_to_try = ['Icon'] + main_config.use_other_images_as_icons
 		for k in keys_to_try:
-			if k in configwriter[image_section_name]:
-				desktop_entry['Icon'] = configwriter[image_section_name][k]
+			if k in sections[image_section_name]:
+				desktop_entry['Icon'] = sections[image_section_name][k]
 				break
 
-	ensure_exist(path)
-	with open(path, 'wt') as f:
-		configwriter.write(f)
+	if main_config.output_folder not in _created_output_folders:
+		pathlib.Path(main_config.output_folder).mkdir(exist_ok=True, parents=True)
+		_created_output_folders.add(main_config.output_folder)
+	_submit_desktop_write(path, sections, format_desktop(sections))
 
-	#Set executable, but also set everything else because whatever
-	os.chmod(path, 0o7777)
+	if _launcher_store is not None:
+		_launcher_store.add_written(path)
+
+	if _existing_launchers is not None and id_section_name in sections:
+		#Keep it up to date, instead of having to go through the output folder again
+		_existing_launchers.add(sections[id_section_name].get('Type'), sections[id_section_name].get('Unique-ID'))
 
 split_brackets = re.compile(r' (?=\()')
 def make_launcher(launch_params, name, metadata, id_type, unique_id):
@@ -204,33 +450,106 @@ def make_launcher(launch_params, name, metadata, id_type, unique_id):
 	fields[id_section_name]['Type'] = id_type
 	fields[id_section_name]['Unique-ID'] = unique_id
 
+	if _deferred_launchers is not None:
+		_deferred_launchers.append((launch_params, display_name, fields))
+		return
+
 	#For very future use, this is where the underlying host platform is abstracted away. Right now we only run on Linux though so zzzzz
 	make_linux_desktop(launch_params, display_name, fields)
 
+_deferred_launchers = None
+def defer_launchers():
+	#For worker processes: don't write anything, just remember what would have been written so the main process can write it all in the same order a serial run would (and hence pick the same filenames)
+	global _deferred_launchers
+	_deferred_launchers = []
+
+def take_deferred_launchers():
+	global _deferred_launchers
+	deferred = _deferred_launchers
+	_deferred_launchers = []
+	return deferred
+
+_id_section_header = '[' + id_section_name + ']'
+def _read_launcher_id(path):
+	#Only needs two fields out of the whole thing, so don't bother with configparser going through all the metadata and everything else
+	game_type = None
+	game_id = None
+	in_id_section = False
+	try:
+		with open(path, 'rt') as f:
+			for line in f:
+				line = line.strip()
+				if line.startswith('['):
+					if in_id_section:
+						break
+					in_id_section = line == _id_section_header
+				elif in_id_section:
+					key, _, value = line.partition('=')
+					key = key.strip()
+					if key == 'Type':
+						game_type = value.strip()
+					elif key == 'Unique-ID':
+						game_id = value.strip()
+	except (OSError, UnicodeDecodeError):
+		pass
+	return game_type, game_id
+
+class LauncherRegistry():
+	#What's already in the output folder, by type and then ID, so looking something up doesn't mean going through everything else
+	def __init__(self):
+		self._ids = {}
+
+	def add(self, game_type, game_id):
+		self._ids.setdefault(game_type, set()).add(game_id)
+
+	def __contains__(self, type_and_id):
+		game_type, game_id = type_and_id
+		return game_id in self._ids.get(game_type, ())
+
+	def __iter__(self):
+		for game_type, game_ids in self._ids.items():
+			for game_id in game_ids:
+				yield game_type, game_id
+
+	def __len__(self):
+		return sum(len(game_ids) for game_ids in self._ids.values())
+
+	def has_any_of_type(self, game_type):
+		return bool(self._ids.get(game_type))
+
 def _get_existing_launchers():
-	a = []
+	registry = LauncherRegistry()
+	flush_desktop_writes()
 
 	output_folder = main_config.output_folder
 	if not os.path.isdir(output_folder):
-		return []
-	for name in os.listdir(output_folder):
-		path = os.path.join(output_folder, name)
-
-		existing_launcher = get_desktop(path)
-		existing_type = get_field(existing_launcher, 'Type', id_section_name)
-		existing_id = get_field(existing_launcher, 'Unique-ID', id_section_name)
-		a.append((existing_type, existing_id))
-
-	return a
+		return registry
+	catalogued = launcher_catalogue.get_catalogue(output_folder).get_rows()
+	for entry in os.scandir(output_folder):
+		if launcher_catalogue.is_catalogue_or_temp_file(entry.name):
+			continue
+
+		row = catalogued.get(entry.name)
+		stat = entry.stat()
+		if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+			existing_type, existing_id = row[2], row[3]
+		else:
+			existing_type, existing_id = _read_launcher_id(entry.path)
+		registry.add(existing_type, existing_id)
+
+	return registry
 _existing_launchers = None
 
-def has_been_done(game_type, game_id):
+def get_existing_launchers():
 	global _existing_launchers #Of course it's global you dicktwat. I swear to fuck this fucking language sometimes, I just wanted to lazy initialize a variable why do you have to make this difficult by making me put spooky keywords in there or forcing me to write some boilerplate shit involving classes and decorators instead, if I wanted to write verbose bullshit I'd program in fucking Java, fuck off
 	if _existing_launchers is None:
 		_existing_launchers = _get_existing_launchers()
+	return _existing_launchers
 
-	for existing_type, existing_id in _existing_launchers:
-		if existing_type == game_type and existing_id == game_id:
-			return True
+def use_existing_launchers(existing_launchers):
+	#So worker processes can be handed what the main process already knows, instead of each of them going through the output folder again
+	global _existing_launchers
+	_existing_launchers = existing_launchers
 
-	return False
+def has_been_done(game_type, game_id):
+	return (game_type, game_id) in get_existing_launchers()
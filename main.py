@@ -3,6 +3,7 @@ import os
 import disambiguate
 import dos
 import gog
+import launchers
 #import mac
 import mame_machines
 import organize_folders
@@ -19,6 +20,7 @@ def main(progress_function, mame_enabled=True, roms_enabled=True, dos_enabled=Tr
 			progress_function(data, should_increment)
 
 	call_progress_function('Creating output folder')
+	launchers.discard_launcher_store()
 
 	if main_config.full_rescan:
 		if os.path.isdir(main_config.output_folder):
@@ -62,6 +64,8 @@ def main(progress_function, mame_enabled=True, roms_enabled=True, dos_enabled=Tr
 
 	call_progress_function('Disambiguating names')
 	disambiguate.disambiguate_names()
+	#Everything from here on just copies the files around, so they need to be up to date now
+	launchers.save_launcher_store()
 
 	if main_config.organize_folders:
 		call_progress_function('Organizing into folders')
@@ -1,10 +1,12 @@
+import concurrent.futures
 import copy
 import functools
 import os
 import re
+import sqlite3
 import subprocess
 import xml.etree.ElementTree as ElementTree
-from pathlib import Path
+from urllib.request import pathname2url
 
 from config.main_config import main_config
 from common import junk_suffixes
@@ -56,6 +58,12 @@ class MAMENotInstalledException(Exception):
 	#This should always end up being caught, because I shouldn't assume the user has stuff installed
 	pass
 
+#Not too many at once, so the command line doesn't get too long, and so there's enough chunks to keep a few MAME processes busy at once
+_verifyroms_chunk_size = 100
+_verifyroms_line = re.compile(r'^romset (?P<basename>\S+) (?:\[\S+\] )?is (?P<status>good|best available|bad)$')
+#These are the other things -verifyroms says, so if we see any of them, it did understand what we asked for
+_verifyroms_summary_line = re.compile(r'^(?:\d+ romsets found, \d+ were OK\.|romset "\S+" not found!)$')
+
 class MameExecutable():
 	def __init__(self, path='mame'):
 		self.executable = path
@@ -63,10 +71,17 @@ class MameExecutable():
 		if self.version:
 			#Do I really wanna be checking that this MAME exists inside the object that represents it? That doesn't entirely make sense to me
 			self.is_installed = True
-			self.xml_cache_path = os.path.join(cache_dir, self.version)
+			self.machine_db_path = os.path.join(cache_dir, self.version + '.db')
+			#Decided here and not when it's being made, so worker processes forked before that know where to look
+			self.building_machine_db_path = '{0}.{1}.tmp'.format(self.machine_db_path, os.getpid())
 		else:
 			self.is_installed = False
-			self.xml_cache_path = None
+			self.machine_db_path = None
+			self.building_machine_db_path = None
+		self._machine_db = None
+		self._machine_db_pid = None
+		self._building_machine_db = None
+		self._building_machine_db_pid = None
 
 		self._icons = None
 
@@ -81,56 +96,117 @@ class MameExecutable():
 		return version_proc.stdout.splitlines()[0]
 
 	
+	def _get_machine_db(self):
+		#sqlite3 connections can't be shared with forked processes (roms.py with more than one job), so each process gets its own
+		pid = os.getpid()
+		if self._machine_db is None or self._machine_db_pid != pid:
+			if not os.path.isfile(self.machine_db_path):
+				return None
+			self._machine_db = sqlite3.connect('file:{0}?mode=ro'.format(pathname2url(self.machine_db_path)), uri=True)
+			self._machine_db_pid = pid
+		return self._machine_db
+
+	def _get_building_machine_db(self):
+		#While -listxml is being read for the first time, everything read so far is in here, so looking up parents/BIOSes/devices doesn't mean running MAME once for each of those
+		pid = os.getpid()
+		if self._building_machine_db is None or self._building_machine_db_pid != pid:
+			if not os.path.isfile(self.building_machine_db_path):
+				return None
+			self._building_machine_db = sqlite3.connect('file:{0}?mode=ro'.format(pathname2url(self.building_machine_db_path)), uri=True, timeout=60)
+			self._building_machine_db_pid = pid
+		return self._building_machine_db
+
+	def _get_streamed_mame_xml(self, driver):
+		db = self._get_building_machine_db()
+		if not db:
+			return None
+		try:
+			row = db.execute('SELECT xml FROM machines WHERE name = ?', (driver, )).fetchone()
+		except sqlite3.OperationalError:
+			#Might have only just been created, and not have the table yet
+			return None
+		if not row:
+			return None
+		return ElementTree.fromstring(row[0])
+
 	def _real_iter_mame_entire_xml(self):
 		print('New MAME version found: ' + self.get_version() + '; creating XML; this may take a while the first time it is run')
-		os.makedirs(self.xml_cache_path, exist_ok=True)
-
-		with subprocess.Popen([self.executable, '-listxml'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
-			#I'm doing what the documentation tells me to not do and effectively using proc.stdout.read
-			try:
-				for _, element in ElementTree.iterparse(proc.stdout):
-					if element.tag == 'machine':
-						my_copy = copy.copy(element)
-						machine_name = element.attrib['name']
-
-						with open(os.path.join(self.xml_cache_path, machine_name + '.xml'), 'wb') as cache_file:
-							cache_file.write(ElementTree.tostring(element))
-						yield machine_name, my_copy
-						element.clear()
-			except ElementTree.ParseError as fuck:
-				#Hmm, this doesn't show us where the error really is
-				if main_config.debug:
-					print('baaagh XML error in listxml', fuck)
-		#Guard against the -listxml process being interrupted and screwing up everything
-		Path(self.xml_cache_path, 'is_done').touch()
+		os.makedirs(os.path.dirname(self.machine_db_path), exist_ok=True)
+
+		#Everything goes into one SQLite database per MAME version, instead of one file per machine, which is a lot of files (and a lot of time spent opening them all) when there are 40,000 or so machines
+		#It's only moved into place at the end, to guard against the -listxml process being interrupted (or us not getting to the end) and screwing up everything
+		temp_path = self.building_machine_db_path
+		if os.path.isfile(temp_path):
+			os.unlink(temp_path)
+		db = sqlite3.connect(temp_path, timeout=60)
+		#If anything goes wrong this just gets thrown away, so there's no point being careful with it, and that makes committing after every machine cheap enough
+		db.execute('PRAGMA journal_mode=OFF')
+		db.execute('PRAGMA synchronous=OFF')
+		#Lookups from this process can see what's been read so far through this connection
+		self._building_machine_db = db
+		self._building_machine_db_pid = os.getpid()
+		is_done = False
+		try:
+			db.execute('CREATE TABLE machines (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, xml BLOB NOT NULL)')
+			db.commit()
+			with subprocess.Popen([self.executable, '-listxml'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+				#I'm doing what the documentation tells me to not do and effectively using proc.stdout.read
+				try:
+					for _, element in ElementTree.iterparse(proc.stdout):
+						if element.tag == 'machine':
+							my_copy = copy.copy(element)
+							machine_name = element.attrib['name']
+
+							db.execute('INSERT INTO machines (name, xml) VALUES (?, ?)', (machine_name, ElementTree.tostring(element)))
+							#So worker processes can see it straight away
+							db.commit()
+							yield machine_name, my_copy
+							element.clear()
+				except ElementTree.ParseError as fuck:
+					#Hmm, this doesn't show us where the error really is
+					if main_config.debug:
+						print('baaagh XML error in listxml', fuck)
+			db.commit()
+			is_done = True
+		finally:
+			self._building_machine_db = None
+			db.close()
+			if is_done:
+				os.replace(temp_path, self.machine_db_path)
+			else:
+				os.unlink(temp_path)
 
 	def _cached_iter_mame_entire_xml(self):
-		for cached_file in os.listdir(self.xml_cache_path):
-			splitty = cached_file.rsplit('.', 1)
-			if len(splitty) != 2:
-				continue
-			driver_name, ext = splitty
-			if ext != 'xml':
-				continue
-			yield driver_name, ElementTree.parse(os.path.join(self.xml_cache_path, cached_file)).getroot()
+		for machine_name, xml in self._get_machine_db().execute('SELECT name, xml FROM machines ORDER BY id'):
+			yield machine_name, ElementTree.fromstring(xml)
 			
 	def iter_mame_entire_xml(self):
-		if os.path.isfile(os.path.join(self.xml_cache_path, 'is_done')):
+		if self._get_machine_db():
 			yield from self._cached_iter_mame_entire_xml()
 		else:
 			yield from self._real_iter_mame_entire_xml()
 		
+	def get_cached_mame_xml(self, driver):
+		#Returns None instead of asking MAME, if we haven't got the whole -listxml yet or it's not in there
+		db = self._get_machine_db() if self.is_installed else None
+		if not db:
+			return None
+		row = db.execute('SELECT xml FROM machines WHERE name = ?', (driver, )).fetchone()
+		if not row:
+			return None
+		return ElementTree.fromstring(row[0])
+
 	def get_mame_xml(self, driver):
 		if not self.is_installed:
 			raise MAMENotInstalledException('MAME not installed for get_mame_xml')
 
-		cache_file_path = os.path.join(self.xml_cache_path, driver + '.xml')
-		try:
-			with open(cache_file_path, 'rb') as cache_file:
-				return ElementTree.parse(cache_file).getroot()
-		except FileNotFoundError:
-			pass
+		machine_xml = self.get_cached_mame_xml(driver)
+		if machine_xml is None:
+			machine_xml = self._get_streamed_mame_xml(driver)
+		if machine_xml is not None:
+			return machine_xml
 
+		#Not read from -listxml yet (clones don't always come after their parents), or we're not reading it at all right now
 		try:
 			proc = subprocess.run([self.executable, '-listxml', driver], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
 		except subprocess.CalledProcessError:
@@ -169,6 +245,37 @@ class MameExecutable():
 		except subprocess.CalledProcessError:
 			return False
 
+	def _verifyroms_chunk(self, basenames):
+		#-verifyroms with more than one name works on newer MAME versions, and it still spends most of its time starting up and loading the ROM paths, so doing that once for a bunch of them is much quicker than once each
+		#Romsets that aren't there at all don't get a line of their own, so anything not mentioned is one we don't have
+		proc = subprocess.run([self.executable, '-verifyroms'] + basenames, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=False)
+		results = {}
+		understood = False
+		for line in proc.stdout.splitlines():
+			line_match = _verifyroms_line.match(line)
+			if line_match:
+				understood = True
+				if line_match['basename'] in basenames:
+					results[line_match['basename']] = line_match['status'] != 'bad'
+			elif _verifyroms_summary_line.match(line):
+				understood = True
+		if not understood:
+			#Must be a version that only does one at a time, so do it that way
+			return {basename: self.verifyroms(basename) for basename in basenames}
+		return {basename: results.get(basename, False) for basename in basenames}
+
+	def verifyroms_many(self, basenames):
+		#basename -> bool, same as calling verifyroms for each one
+		basenames = list(dict.fromkeys(basenames))
+		if not basenames:
+			return {}
+		chunks = [basenames[i:i + _verifyroms_chunk_size] for i in range(0, len(basenames), _verifyroms_chunk_size)]
+		results = {}
+		with concurrent.futures.ThreadPoolExecutor(min(len(chunks), os.cpu_count() or 1)) as pool:
+			for chunk_results in pool.map(self._verifyroms_chunk, chunks):
+				results.update(chunk_results)
+		return results
+
 	#Other frontend commands: listfull, listclones, listbrothers, listcrc, listroms, listsamples, verifysamples, romident, listdevices, listslots, listmedia, listsoftware, verifysoftware, getsoftlist
 
 class DefaultMameExecutable():
@@ -267,6 +374,9 @@ def iter_mame_entire_xml():
 def get_mame_xml(driver):
 	return default_mame_executable.get_mame_xml(driver)
 
+def get_cached_mame_xml(driver):
+	return default_mame_executable.get_cached_mame_xml(driver)
+
 def list_by_source_file():
 	return default_mame_executable.listsource()
 
@@ -288,22 +398,25 @@ def _tag_starts_with(tag, tag_list):
 			return True
 	return False
 
-def find_cpus(machine_xml):
-	cpu_xmls = [chip for chip in machine_xml.findall('chip') if chip.attrib.get('type') == 'cpu']
+def find_cpus(cpu_xmls):
+	#cpu_xmls is the attributes of each <chip type="cpu"> element
 	if not cpu_xmls:
 		return []
 
 	#audio_cpu_tags = ('audio_cpu', 'audiocpu', 'soundcpu', 'sndcpu', 'sound_cpu', 'genesis_snd_z80', 'pokey', 'audio', 'sounddsp', 'soundcpu_b', 'speechcpu')
-	#cpu_xmls = [cpu for cpu in cpu_xmls if not _tag_starts_with(cpu.attrib.get('tag'), audio_cpu_tags)]
+	#cpu_xmls = [cpu for cpu in cpu_xmls if not _tag_starts_with(cpu.get('tag'), audio_cpu_tags)]
 
 	#Skip microcontrollers etc
 	#Do I really want to though? I can't even remember what I was doing any of this for
 	microcontrollers = ('mcu', 'iomcu', 'dma', 'dma8237', 'iop_dma', 'dmac', 'i8237', 'i8257', 'i8741')
 	device_controllers = ('fdccpu', 'dial_mcu_left', 'dial_mcu_right', 'adbmicro', 'printer_mcu', 'keyboard_mcu', 'keyb_mcu', 'motorcpu', 'drivecpu', 'z80fd', 'm3commcpu', 'mie')
 	controller_tags = microcontrollers + device_controllers + ('prot', 'iop', 'iocpu', 'cia')
-	cpu_xmls = [cpu for cpu in cpu_xmls if not _tag_starts_with(cpu.attrib.get('tag'), controller_tags)]
+	cpu_xmls = [cpu for cpu in cpu_xmls if not _tag_starts_with(cpu.get('tag'), controller_tags)]
 	
 	return cpu_xmls
 
 def verify_romset(basename):
 	return default_mame_executable.verifyroms(basename)
+
+def verify_romsets(basenames):
+	return default_mame_executable.verifyroms_many(basenames)
@@ -1,3 +1,4 @@
+import collections
 import re
 
 from common import (find_filename_tags_at_end, normalize_name,
@@ -14,6 +15,8 @@ from metadata import Metadata, Date
 
 
 class MediaSlot():
+	__slots__ = ('type', 'tag', 'fixed_image', 'mandatory', 'interface', 'instances', 'extensions')
+
 	def __init__(self, xml):
 		self.type = xml.attrib.get('type')
 		self.tag = xml.attrib.get('tag')
@@ -22,8 +25,101 @@ class MediaSlot():
 		self.interface = xml.attrib.get('interface')
 		
 		#This is the actual thing you see in -listmedia and use to insert media
-		self.instances = [(instance_xml.attrib.get('name'), instance_xml.get('briefname')) for instance_xml in xml.findall('instance')]
-		self.extensions = {extension_xml.attrib.get('name') for extension_xml in xml.findall('extension')}
+		self.instances = tuple((instance_xml.attrib.get('name'), instance_xml.get('briefname')) for instance_xml in xml.findall('instance'))
+		self.extensions = frozenset(extension_xml.attrib.get('name') for extension_xml in xml.findall('extension'))
+
+class MachineRecord():
+	#Everything we use from a <machine> element, got out of it all in one go, so we don't have to keep the whole element tree around (which adds up when there's tens of thousands of them) or keep doing find/findall on it
+	#Things that come from child elements MAME only has one of use the first one, like find would
+	__slots__ = ('basename', 'source_file', 'cloneof', 'romof', 'sampleof', 'is_runnable', 'is_bios', 'is_device', 'is_mechanical',
+		'description', 'year', 'manufacturer', 'has_input', 'players', 'coins', 'controls', 'driver', 'features', 'device_refs',
+		'requires_chds', 'romless', 'media_slots', 'software_lists', 'cpus', 'displays')
+
+	def __init__(self, xml):
+		attrib = xml.attrib
+		self.basename = attrib['name']
+		self.source_file = attrib.get('sourcefile')
+		self.cloneof = attrib.get('cloneof')
+		self.romof = attrib.get('romof')
+		self.sampleof = attrib.get('sampleof')
+		self.is_runnable = attrib.get('runnable', 'yes') != 'no'
+		self.is_bios = attrib.get('isbios', 'no') == 'yes'
+		self.is_device = attrib.get('isdevice', 'no') == 'yes'
+		self.is_mechanical = attrib.get('ismechanical', 'no') == 'yes'
+
+		self.description = None
+		self.year = None
+		self.manufacturer = None
+		self.has_input = False
+		self.players = 0
+		self.coins = 0
+		self.driver = None
+		self.requires_chds = False
+		features = {}
+		device_refs = set()
+		controls = []
+		media_slots = []
+		software_lists = []
+		cpus = []
+		displays = []
+		has_dumped_roms = False
+
+		for child in xml:
+			tag = child.tag
+			if tag == 'rom':
+				if child.attrib.get('status', 'good') != 'nodump':
+					has_dumped_roms = True
+			elif tag == 'device_ref':
+				device_refs.add(child.attrib.get('name'))
+			elif tag == 'chip':
+				if child.attrib.get('type') == 'cpu':
+					cpus.append(child.attrib)
+			elif tag == 'display':
+				displays.append(child.attrib)
+			elif tag == 'feature':
+				if 'status' in child.attrib:
+					features[child.attrib['type']] = child.attrib['status']
+				elif 'overall' in child.attrib:
+					#wat?
+					features[child.attrib['type']] = child.attrib['overall']
+				#Known types according to DTD: protection, palette, graphics, sound, controls, keyboard, mouse, microphone, camera, disk, printer, lan, wan, timing
+				#Note: MAME 0.208 has added capture, media, tape, punch, drum, rom, comms; although because I have been somewhat clever in writing this code, I don't need to hardcode any of that anyway
+			elif tag == 'device':
+				media_slots.append(MediaSlot(child))
+			elif tag == 'softwarelist':
+				software_lists.append(child.attrib.get('name'))
+			elif tag == 'disk':
+				self.requires_chds = True
+			elif tag == 'description':
+				if self.description is None:
+					self.description = child.text or ''
+			elif tag == 'year':
+				if self.year is None:
+					self.year = child.text or ''
+			elif tag == 'manufacturer':
+				if self.manufacturer is None:
+					self.manufacturer = child.text or ''
+			elif tag == 'input':
+				if not self.has_input:
+					self.has_input = True
+					self.players = int(child.attrib.get('players', 0))
+					self.coins = child.attrib.get('coins', 0)
+					controls = [control.attrib for control in child.findall('control')]
+			elif tag == 'driver':
+				if self.driver is None:
+					self.driver = child.attrib
+
+		self.features = features
+		self.device_refs = frozenset(device_refs)
+		self.controls = tuple(controls)
+		self.media_slots = tuple(media_slots)
+		self.software_lists = tuple(software_lists)
+		self.cpus = tuple(cpus)
+		self.displays = tuple(displays)
+		#Hmm... should requires_chds include where all <disk> has status == "nodump"? e.g. Dragon's Lair has no CHD dump, would it be useful to say that it requires CHDs because it's supposed to have one but doesn't, or not, because you have a good romset without one
+		#I guess I should have a look at how the MAME inbuilt UI does this
+		#Who really uses this kind of thing, anyway?
+		self.romless = not self.requires_chds and not has_dumped_roms
 
 arcade_system_names = {
 	#Normal stuff
@@ -398,11 +494,12 @@ hack_regex = re.compile(r'^hack \((.+)\)$')
 bootleg_with_publisher_regex = re.compile(r'^bootleg \((.+)\)$')
 class Machine():
 	def __init__(self, xml, init_metadata=False):
-		self.xml = xml
+		#Nothing holds onto xml after this, so it can be thrown away as soon as whoever gave it to us is done with it
+		self.record = MachineRecord(xml)
 		#This can't be a property because we might need to override it later, so stop trying to do that
-		self.name = self.xml.findtext('description')
+		self.name = self.record.description
 
-		cloneof = self.xml.attrib.get('cloneof')
+		cloneof = self.record.cloneof
 		if cloneof:
 			self.has_parent = True
 			self.parent_basename = cloneof
@@ -462,7 +559,7 @@ class Machine():
 		self.metadata.specific_info['Family'] = self.family_name
 		self.metadata.specific_info['Has-Parent'] = self.has_parent
 
-		self.metadata.release_date = Date(self.xml.findtext('year'))
+		self.metadata.release_date = Date(self.record.year)
 
 		self.metadata.specific_info['Number-of-Players'] = self.number_of_players
 		self.metadata.specific_info['Is-Mechanical'] = self.is_mechanical
@@ -495,7 +592,7 @@ class Machine():
 
 	@property
 	def basename(self):
-		return self.xml.attrib['name']
+		return self.record.basename
 
 	@property
 	def parent(self):
@@ -503,7 +600,7 @@ class Machine():
 			return None
 			
 		if not self._parent:
-			self._parent = Machine(get_mame_xml(self.parent_basename), True)
+			self._parent = get_family_machine(self.parent_basename)
 		return self._parent
 
 	@property
@@ -516,62 +613,38 @@ class Machine():
 	
 	@property
 	def source_file(self):
-		return self.xml.attrib['sourcefile'].rsplit('.', 1)[0]
+		return self.record.source_file.rsplit('.', 1)[0]
 
 	@property
 	def is_mechanical(self):
-		return self.xml.attrib.get('ismechanical', 'no') == 'yes'
-
-	@property
-	def input_element(self):
-		return self.xml.find('input')
+		return self.record.is_mechanical
 
 	@property
 	def coin_slots(self):
-		return self.input_element.attrib.get('coins', 0) if self.input_element is not None else 0
+		return self.record.coins
 
 	@property
 	def number_of_players(self):
-		if self.input_element is None:
-			#This would happen if we ended up loading a device or whatever, so let's not crash the whole dang program. Also, since you can't play a device, they have 0 players. But they won't have launchers anyway, this is just to stop the NoneType explosion.
-			return 0
-		return int(self.input_element.attrib.get('players', 0))
-
-	@property
-	def driver_element(self):
-		return self.xml.find('driver')
+		#If there's no input element, this would happen if we ended up loading a device or whatever, so let's not crash the whole dang program. Also, since you can't play a device, they have 0 players. But they won't have launchers anyway, this is just to stop the NoneType explosion.
+		return self.record.players
 
 	@property
 	def overall_status(self):
 		#Hmm, so how this works according to https://github.com/mamedev/mame/blob/master/src/frontend/mame/info.cpp: if any particular feature is preliminary, this is preliminary, if any feature is imperfect this is imperfect, unless protection = imperfect then this is preliminary
 		#It even says it's for the convenience of frontend developers, but since I'm an ungrateful piece of shit and I always feel the need to take matters into my own hands, I'm gonna get the other parts of the emulation too
-		if self.driver_element is None:
+		if self.record.driver is None:
 			return EmulationStatus.Unknown
-		return mame_statuses.get(self.driver_element.attrib.get('status'), EmulationStatus.Unknown)
+		return mame_statuses.get(self.record.driver.get('status'), EmulationStatus.Unknown)
 
 	@property
 	def emulation_status(self):
-		if self.driver_element is None:
+		if self.record.driver is None:
 			return EmulationStatus.Unknown
-		return mame_statuses.get(self.driver_element.attrib.get('emulation'), EmulationStatus.Unknown)
+		return mame_statuses.get(self.record.driver.get('emulation'), EmulationStatus.Unknown)
 
 	@property
 	def feature_statuses(self):
-		features = {}
-		for feature in self.xml.findall('feature'):
-			feature_type = feature.attrib['type']
-			if 'status' in feature.attrib:
-				feature_status = feature.attrib['status']
-			elif 'overall' in feature.attrib:
-				#wat?
-				feature_status = feature.attrib['overall']
-			else:
-				continue
-			
-			features[feature_type] = feature_status
-			#Known types according to DTD: protection, palette, graphics, sound, controls, keyboard, mouse, microphone, camera, disk, printer, lan, wan, timing
-			#Note: MAME 0.208 has added capture, media, tape, punch, drum, rom, comms; although because I have been somewhat clever in writing this code, I don't need to hardcode any of that anyway
-		return features
+		return self.record.features
 
 	@property
 	def is_skeleton_driver(self):
@@ -581,34 +654,19 @@ class Machine():
 		return self.number_of_players == 0 and self.emulation_status in (EmulationStatus.Broken, EmulationStatus.Unknown) and self.feature_statuses.get('sound') == 'unemulated'
 
 	def uses_device(self, name):
-		for device_ref in self.xml.findall('device_ref'):
-			if device_ref.attrib['name'] == name:
-				return True
-
-		return False
+		return name in self.record.device_refs
 
 	@property
 	def requires_chds(self):
-		#Hmm... should this include where all <disk> has status == "nodump"? e.g. Dragon's Lair has no CHD dump, would it be useful to say that it requires CHDs because it's supposed to have one but doesn't, or not, because you have a good romset without one
-		#I guess I should have a look at how the MAME inbuilt UI does this
-		#Who really uses this kind of thing, anyway?
-		return self.xml.find('disk') is not None
+		return self.record.requires_chds
 
 	@property
 	def romless(self):
-		if self.requires_chds:
-			return False
-		if self.xml.find('rom') is None:
-			return True
-
-		for rom in self.xml.findall('rom'):
-			if rom.attrib.get('status', 'good') != 'nodump':
-				return False
-		return True
+		return self.record.romless
 
 	@property
 	def bios_basename(self):
-		romof = self.xml.attrib.get('romof')
+		romof = self.record.romof
 		if self.has_parent and romof == self.family:
 			return self.parent.bios_basename
 		if romof:
@@ -619,16 +677,16 @@ class Machine():
 	def bios(self):
 		bios_basename = self.bios_basename
 		if bios_basename:
-			return Machine(get_mame_xml(bios_basename), True)
+			return get_family_machine(bios_basename)
 		return None
 		
 	@property
 	def samples_used(self):
-		return self.xml.attrib.get('sampleof')
+		return self.record.sampleof
 
 	@property
 	def media_slots(self):
-		return [MediaSlot(device_xml) for device_xml in self.xml.findall('device')]
+		return self.record.media_slots
 
 	@property
 	def has_mandatory_slots(self):
@@ -636,11 +694,11 @@ class Machine():
 
 	@property
 	def software_lists(self):
-		return [software_list.attrib.get('name') for software_list in self.xml.findall('softwarelist')]
+		return list(self.record.software_lists)
 
 	@property
 	def manufacturer(self):
-		return self.xml.findtext('manufacturer')
+		return self.record.manufacturer
 
 	@property
 	def is_hack(self):
@@ -770,6 +828,23 @@ class Machine():
 		return self.family in all_mame_drivers
 
 	
+#How many parents/BIOSes to keep around; they only ever get read from, so every clone of something can share the same one
+family_cache_size = 500
+_family_cache = collections.OrderedDict() #basename -> Machine
+
+def get_family_machine(basename):
+	#Every clone asks for its parent (and most things ask for their BIOS) when getting metadata, and making a Machine with metadata means going through catlist and all that, so don't do it again for each one
+	#-listxml is sorted by basename and not by family, so we can't really tell when we're done with a family, but clones tend to be named similarly to each other and end up close together anyway, and BIOSes get used often enough to stay in here
+	machine = _family_cache.get(basename)
+	if machine:
+		_family_cache.move_to_end(basename)
+		return machine
+	machine = Machine(get_mame_xml(basename), True)
+	_family_cache[basename] = machine
+	if len(_family_cache) > family_cache_size:
+		_family_cache.popitem(last=False)
+	return machine
+
 def get_machine(driver):
 	return Machine(get_mame_xml(driver))
 
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
+import collections
 import datetime
+import multiprocessing
 import sys
 import time
+import xml.etree.ElementTree as ElementTree
 
 import launchers
 from common_types import EmulationStatus
@@ -10,19 +13,20 @@ from config.main_config import main_config
 from data.machines_with_inbuilt_games import (bioses_with_inbuilt_games,
                                               machines_with_inbuilt_games)
 from info import emulator_command_line_helpers
-from mame_helpers import get_mame_xml, iter_mame_entire_xml, verify_romset
+from mame_helpers import get_mame_xml, iter_mame_entire_xml
 from mame_machine import Machine, get_machines_from_source_file
 from mame_metadata import add_metadata, add_status
+from romset_verify_cache import verify_romset, verify_romsets
 
 
 def is_actually_machine(machine):
-	if machine.xml.attrib.get('runnable', 'yes') == 'no':
+	if not machine.record.is_runnable:
 		return False
 
-	if machine.xml.attrib.get('isbios', 'no') == 'yes': #Hmm, technically there's nothing stopping you launching these
+	if machine.record.is_bios: #Hmm, technically there's nothing stopping you launching these
 		return False
 
-	if machine.xml.attrib.get('isdevice', 'no') == 'yes':
+	if machine.record.is_device:
 		return False
 
 	return True
@@ -72,38 +76,112 @@ def no_longer_exists(game_id):
 	#This is used to determine what launchers to delete if not doing a full rescan
 	return not verify_romset(game_id)
 
-def process_machine_element(machine_element):
+def which_no_longer_exist(game_ids):
+	#Same as no_longer_exists, but for a whole bunch of them at once, which is a lot quicker than starting MAME up for each one
+	return {game_id for game_id, exists in verify_romsets(game_ids).items() if not exists}
+
+#How many machines to wait for before verifying them all at once
+verify_batch_size = 1000
+
+def get_wanted_machine(machine_element):
 	machine = Machine(machine_element)
 	if machine.source_file in main_config.skipped_source_files:
-		return
+		return None
 
 	if not is_actually_machine(machine):
-		return
+		return None
 
 	if not is_machine_launchable(machine):
-		return
+		return None
 
 	if not does_user_want_machine(machine):
-		return
+		return None
 
 	if main_config.exclude_non_working and machine.emulation_status == EmulationStatus.Broken and machine.basename not in main_config.non_working_whitelist:
 		#This will need to be refactored if anything other than MAME is added
 		#The code behind -listxml is of the opinion that protection = imperfect should result in a system being considered entirely broken, but I'm not so sure if that works out
-		return
+		return None
 
-	if not verify_romset(machine.basename):
-		#We do this as late as we can after checks to see if we want to actually add this machine or not, because it takes a while (in a loop of tens of thousands of machines), and hence if we can get out of having to do it we should
-		#However this is a reminder to myself to stop trying to be clever (because I am not); we cannot assume -verifyroms would succeed if machine.romless is true because there might be a device which is not romless
-		return
+	return machine
+
+def process_machines(machines):
+	#We do verification as late as we can after checks to see if we want to actually add this machine or not, because it takes a while (in a loop of tens of thousands of machines), and hence if we can get out of having to do it we should
+	#However this is a reminder to myself to stop trying to be clever (because I am not); we cannot assume -verifyroms would succeed if machine.romless is true because there might be a device which is not romless
+	#Doing a bunch of them at once means MAME doesn't have to start up for every single one, and the ones we already know about from last time don't need verifying again
+	verified = verify_romsets([machine.basename for machine in machines])
+	for machine in machines:
+		if verified[machine.basename]:
+			process_machine(machine)
 
-	process_machine(machine)
+def process_machine_element(machine_element):
+	machine = get_wanted_machine(machine_element)
+	if machine:
+		process_machines([machine])
 
-def process_inbuilt_game(machine_name, inbuilt_game, bios_name=None):
-	if not verify_romset(machine_name):
-		return
+#How many machines each worker gets at once when doing this in parallel
+machines_per_work_unit = 200
+
+def _init_arcade_worker():
+	launchers.defer_launchers()
+
+def _process_arcade_work_unit(machine_xmls):
+	machines = [get_wanted_machine(ElementTree.fromstring(machine_xml)) for machine_xml in machine_xmls]
+	process_machines([machine for machine in machines if machine])
+	return launchers.take_deferred_launchers()
+
+def _iter_arcade_work_units():
+	work_unit = []
+	for machine_name, machine_element in iter_mame_entire_xml():
+		if not main_config.full_rescan:
+			if launchers.has_been_done('Arcade', machine_name):
+				continue
+			if launchers.has_been_done('MAME', machine_name):
+				continue
+
+		#Elements get sent to the workers as bytes, which is cheaper to pickle
+		work_unit.append(ElementTree.tostring(machine_element))
+		if len(work_unit) >= machines_per_work_unit:
+			yield work_unit
+			work_unit = []
+	if work_unit:
+		yield work_unit
+
+def _make_deferred_launchers(deferred_launchers):
+	for launch_params, display_name, fields in deferred_launchers:
+		launchers.make_linux_desktop(launch_params, display_name, fields)
+
+def process_arcade_machines_in_parallel(jobs):
+	#The main process just reads -listxml, and workers do everything from there up until figuring out what the launchers should be; then the main process writes them all out in the same order as a serial run would, so everything gets the same filename
+	with multiprocessing.Pool(jobs, initializer=_init_arcade_worker) as pool:
+		pending = collections.deque()
+		for work_unit in _iter_arcade_work_units():
+			pending.append(pool.apply_async(_process_arcade_work_unit, (work_unit, )))
+			#Don't read too far ahead of the workers, or we'll just end up with most of -listxml sitting around in memory waiting for them
+			while len(pending) > jobs * 2:
+				_make_deferred_launchers(pending.popleft().get())
+		while pending:
+			_make_deferred_launchers(pending.popleft().get())
+
+def process_arcade_machines():
+	machines_to_verify = []
+	for machine_name, machine_element in iter_mame_entire_xml():
+		if not main_config.full_rescan:
+			if launchers.has_been_done('Arcade', machine_name):
+				continue
+			if launchers.has_been_done('MAME', machine_name):
+				continue
 
+		machine = get_wanted_machine(machine_element)
+		if machine:
+			machines_to_verify.append(machine)
+			if len(machines_to_verify) >= verify_batch_size:
+				process_machines(machines_to_verify)
+				machines_to_verify = []
+	process_machines(machines_to_verify)
+
+def process_inbuilt_game(machine_name, inbuilt_game, bios_name=None):
 	machine_xml = get_mame_xml(machine_name)
-	#MachineNotFoundException shouldn't happen because verify_romset already returned true? Probably
+	#MachineNotFoundException shouldn't happen because the romset was already verified? Probably
 	machine = Machine(machine_xml, init_metadata=True)
 	
 	machine.metadata.platform = inbuilt_game[1]
@@ -126,14 +204,10 @@ def process_inbuilt_game(machine_name, inbuilt_game, bios_name=None):
 def process_arcade():
 	time_started = time.perf_counter()
 
-	for machine_name, machine_element in iter_mame_entire_xml():
-		if not main_config.full_rescan:
-			if launchers.has_been_done('Arcade', machine_name):
-				continue
-			if launchers.has_been_done('MAME', machine_name):
-				continue
-
-		process_machine_element(machine_element)
+	if main_config.jobs > 1:
+		process_arcade_machines_in_parallel(main_config.jobs)
+	else:
+		process_arcade_machines()
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -141,16 +215,22 @@ def process_arcade():
 
 	time_started = time.perf_counter()
 
+	inbuilt_games_to_do = []
 	for machine_name, inbuilt_game in machines_with_inbuilt_games.items():
 		if not main_config.full_rescan:
 			if launchers.has_been_done('Inbuilt game', machine_name):
 				continue
-		process_inbuilt_game(machine_name, inbuilt_game)
+		inbuilt_games_to_do.append((machine_name, inbuilt_game, None))
 	for machine_and_bios_name, inbuilt_game in bioses_with_inbuilt_games.items():
 		if not main_config.full_rescan:
 			if launchers.has_been_done('Inbuilt game', machine_and_bios_name[0] + ':' + machine_and_bios_name[1]):
 				continue
-		process_inbuilt_game(machine_and_bios_name[0], inbuilt_game, machine_and_bios_name[1])
+		inbuilt_games_to_do.append((machine_and_bios_name[0], inbuilt_game, machine_and_bios_name[1]))
+
+	verified = verify_romsets([machine_name for machine_name, _, _ in inbuilt_games_to_do])
+	for machine_name, inbuilt_game, bios_name in inbuilt_games_to_do:
+		if verified[machine_name]:
+			process_inbuilt_game(machine_name, inbuilt_game, bios_name)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
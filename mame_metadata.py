@@ -115,12 +115,12 @@ def add_save_type(machine):
 		machine.metadata.save_type = SaveType.Internal if has_nvram or has_i2cmem else SaveType.Nothing
 
 def add_status(machine):
-	driver = machine.driver_element
+	driver = machine.record.driver
 	#See comments for overall_status property for what that actually means
 	machine.metadata.specific_info['MAME-Overall-Emulation-Status'] = machine.overall_status
 	machine.metadata.specific_info['MAME-Emulation-Status'] = machine.emulation_status
-	machine.metadata.specific_info['Cocktail-Status'] = mame_statuses.get(driver.attrib.get('cocktail'), EmulationStatus.Good)
-	machine.metadata.specific_info['Supports-Savestate'] = driver.attrib.get('savestate') == 'supported'
+	machine.metadata.specific_info['Cocktail-Status'] = mame_statuses.get(driver.get('cocktail'), EmulationStatus.Good)
+	machine.metadata.specific_info['Supports-Savestate'] = driver.get('savestate') == 'supported'
 
 	unemulated_features = []
 	for feature_type, feature_status in machine.feature_statuses.items():
@@ -341,16 +341,15 @@ def add_metadata(machine):
 	add_images(machine)
 
 	machine.metadata.cpu_info.set_inited()
-	cpus = find_cpus(machine.xml)
+	cpus = find_cpus(machine.record.cpus)
 	if cpus:
-		for cpu_xml in cpus:
+		for cpu_attribs in cpus:
 			cpu = CPU()
-			cpu.load_from_xml(cpu_xml)
+			cpu.load_from_attribs(cpu_attribs)
 			machine.metadata.cpu_info.add_cpu(cpu)
 
 	machine.metadata.screen_info = ScreenInfo()
-	displays = machine.xml.findall('display')
-	machine.metadata.screen_info.load_from_xml_list(displays)
+	machine.metadata.screen_info.load_from_attribs_list(machine.record.displays)
 
 	add_input_info(machine)
 	add_save_type(machine)
@@ -374,13 +373,13 @@ def add_metadata(machine):
 
 def add_input_info(machine):
 	machine.metadata.input_info.set_inited()
-	if machine.input_element is None:
+	if not machine.record.has_input:
 		#Seems like this doesn't actually happen
 		if main_config.debug:
 			print('Oi m8', machine.basename, '/', machine.name, 'has no input')
 		return
 
-	control_elements = machine.input_element.findall('control')
+	control_elements = machine.record.controls
 	if not control_elements:
 		#Sometimes you get some games with 1 or more players, but no control type defined.  This usually happens with
 		#pinball games and weird stuff like a clock, but also some genuine games like Crazy Fight that are more or less
@@ -396,9 +395,9 @@ def add_input_info(machine):
 	normal_input = input_metadata.NormalController()
 
 	for control in control_elements:
-		buttons = int(control.attrib.get('buttons', 0))
+		buttons = int(control.get('buttons', 0))
 
-		if control.attrib.get('player', '1') != '1':
+		if control.get('player', '1') != '1':
 			#I care not for these "other people" and "social interaction" concepts
 			#Anyway, this would only matter for stuff where player 2 has a different control scheme like Lucky & Wild, and... not sure what I'm gonna do about that, because we wanna avoid doubling up on input types where number of players > 1, and then that seems to be correct anyway
 			continue
@@ -406,7 +405,7 @@ def add_input_info(machine):
 		#Still kinda feel like this is messy but ehhh
 		#Input metadata will probably never be perfect, MAME -listxml outputs things for a different purpose really, it just be like that sometimes
 		#I wonder if I'd be better off making some kind of controls.ini file myself
-		input_type = control.attrib['type']
+		input_type = control['type']
 		if input_type == 'only_buttons':
 			has_normal_input = True
 			normal_input.face_buttons += buttons
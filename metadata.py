@@ -31,12 +31,13 @@ class CPU():
 			return CPU.format_clock_speed(self.clock_speed)
 		return None
 
-	def load_from_xml(self, xml):
-		self.chip_name = xml.attrib.get('name')
-		self.tag = xml.attrib.get('tag')
-		if xml.attrib['name'] != 'Netlist CPU Device' and 'clock' in xml.attrib:
+	def load_from_attribs(self, attribs):
+		#attribs is from a <chip> element in MAME -listxml
+		self.chip_name = attribs.get('name')
+		self.tag = attribs.get('tag')
+		if attribs['name'] != 'Netlist CPU Device' and 'clock' in attribs:
 			try:
-				self.clock_speed = int(xml.attrib['clock'])
+				self.clock_speed = int(attribs['clock'])
 			except ValueError:
 				pass
 
@@ -98,16 +99,17 @@ class Screen():
 		#Other types are vector (Asteroids, etc) or svg (Game & Watch games, etc)
 		return self.type.capitalize() if self.type else None
 
-	def load_from_xml(self, xml):
-		self.type = xml.attrib['type']
-		self.tag = xml.attrib['tag']
+	def load_from_attribs(self, attribs):
+		#attribs is from a <display> element in MAME -listxml
+		self.type = attribs['type']
+		self.tag = attribs['tag']
 		if self.type == 'raster' or self.type == 'lcd':
-			self.width = float(xml.attrib['width'])
-			self.height = float(xml.attrib['height'])
+			self.width = float(attribs['width'])
+			self.height = float(attribs['height'])
 
-		if 'refresh' in xml.attrib:
+		if 'refresh' in attribs:
 			try:
-				self.refresh_rate = float(xml.attrib['refresh'])
+				self.refresh_rate = float(attribs['refresh'])
 			except ValueError:
 				pass
 
@@ -137,10 +139,10 @@ class ScreenInfo():
 	def get_number_of_screens(self):
 		return len(self.screens)
 
-	def load_from_xml_list(self, xmls):
-		for display in xmls:
+	def load_from_attribs_list(self, attribs_list):
+		for display in attribs_list:
 			screen = Screen()
-			screen.load_from_xml(display)
+			screen.load_from_attribs(display)
 			self.screens.append(screen)
 
 	def get_screen_resolutions(self):
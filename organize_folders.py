@@ -3,6 +3,7 @@
 import datetime
 import os
 import shutil
+import stat
 import sys
 import time
 
@@ -14,29 +15,83 @@ from io_utils import sanitize_name
 #Consider it to be its own kind of frontend, perhaps.
 #This code sucks titty balls
 
+#When move_into_folders is working out what should be where: destination path -> launcher path
+_wanted_files = None
+
+def place_file(path, dest_path):
+	if main_config.organized_folder_links == 'symlink':
+		os.symlink(path, dest_path)
+		return
+	if main_config.organized_folder_links == 'hardlink':
+		try:
+			os.link(path, dest_path)
+			return
+		except OSError:
+			#Probably on a different filesystem, so that's not going to work
+			pass
+	#copy2 so the mtime is kept, and we can tell next time whether it needs copying again
+	shutil.copy2(path, dest_path)
+
+def is_placed_file_up_to_date(path, path_stat, dest_path, dest_stat):
+	if stat.S_ISLNK(dest_stat.st_mode):
+		return main_config.organized_folder_links == 'symlink' and os.readlink(dest_path) == path
+	if main_config.organized_folder_links == 'symlink':
+		return False
+	if dest_stat.st_ino == path_stat.st_ino and dest_stat.st_dev == path_stat.st_dev:
+		return main_config.organized_folder_links == 'hardlink'
+	return dest_stat.st_size == path_stat.st_size and dest_stat.st_mtime_ns == path_stat.st_mtime_ns
+
 def copy_to_folder(path, *dest_folder_components):
 	dest_folder = os.path.join(*dest_folder_components)
+	dest_path = os.path.join(dest_folder, os.path.basename(path))
+	if _wanted_files is not None:
+		_wanted_files[dest_path] = path
+		return
 	os.makedirs(dest_folder, exist_ok=True)
-	shutil.copy(path, dest_folder)
-
-def delete_existing_output_dir():
-	def rmdir_recursive(path):
-		for f in os.listdir(path):
-			file_path = os.path.join(path, f)
-			if os.path.isdir(file_path):
-				rmdir_recursive(file_path)
-			else:
-				os.unlink(file_path)
-		try:
-			os.rmdir(path)
-		except FileNotFoundError:
-			pass
+	if os.path.lexists(dest_path):
+		os.unlink(dest_path)
+	place_file(path, dest_path)
 
+def update_organized_folder(wanted_files):
+	#Only touch what's actually different from last time, instead of deleting everything and copying it all again
+	existing = {}
 	if os.path.isdir(main_config.organized_output_folder):
-		for f in os.listdir(main_config.organized_output_folder):
-			path = os.path.join(main_config.organized_output_folder, f)
-			rmdir_recursive(path)
-			#Only files here, no directories
+		for root, _, files in os.walk(main_config.organized_output_folder):
+			for f in files:
+				dest_path = os.path.join(root, f)
+				existing[dest_path] = os.lstat(dest_path)
+
+	removed = 0
+	for dest_path in existing.keys() - wanted_files.keys():
+		os.unlink(dest_path)
+		removed += 1
+
+	added = 0
+	path_stats = {}
+	created_folders = set()
+	for dest_path, path in wanted_files.items():
+		if dest_path in existing:
+			if path not in path_stats:
+				path_stats[path] = os.stat(path)
+			if is_placed_file_up_to_date(path, path_stats[path], dest_path, existing[dest_path]):
+				continue
+			os.unlink(dest_path)
+		else:
+			dest_folder = os.path.dirname(dest_path)
+			if dest_folder not in created_folders:
+				os.makedirs(dest_folder, exist_ok=True)
+				created_folders.add(dest_folder)
+		place_file(path, dest_path)
+		added += 1
+
+	if removed and os.path.isdir(main_config.organized_output_folder):
+		for root, folders, files in os.walk(main_config.organized_output_folder, topdown=False):
+			if root != main_config.organized_output_folder and not folders and not files:
+				try:
+					os.rmdir(root)
+				except OSError:
+					pass
+	return added, removed
 
 def move_into_extra_subfolder(path, desktop, subfolder, keys, missing_value=None):
 	subsubfolder = []
@@ -133,8 +188,7 @@ def move_into_extra_subfolder(path, desktop, subfolder, keys, missing_value=None
 			else:
 				copy_to_folder(path, main_config.organized_output_folder, subfolder)
 
-def move_into_subfolders(path):
-	desktop = launchers.get_desktop(path)
+def move_into_subfolders(path, desktop):
 	platform = launchers.get_field(desktop, 'Platform')
 	categories = launchers.get_array(desktop, 'Categories')
 	languages = launchers.get_array(desktop, 'Languages')
@@ -174,25 +228,22 @@ def move_into_subfolders(path):
 		copy_to_folder(path, main_config.organized_output_folder, 'By language', sanitize_name(languages[0]) + ' only')
 
 def move_into_folders():
+	global _wanted_files
 	time_started = time.perf_counter()
 
-	delete_existing_output_dir()
-	if main_config.print_times:
-		time_ended = time.perf_counter()
-		print('Removal of old organized folder finished in', str(datetime.timedelta(seconds=time_ended - time_started)))
-
-	time_started = time.perf_counter()
-
-	for root, _, files in os.walk(main_config.output_folder):
-		for f in files:
-			if f.endswith('.desktop'):
-				path = os.path.join(root, f)
-
-				move_into_subfolders(path)
+	_wanted_files = {}
+	try:
+		for path, desktop in launchers.get_launcher_store():
+			if path.endswith('.desktop'):
+				move_into_subfolders(path, desktop)
+		wanted_files = _wanted_files
+	finally:
+		_wanted_files = None
+	added, removed = update_organized_folder(wanted_files)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
-		print('Folder organization finished in', str(datetime.timedelta(seconds=time_ended - time_started)))
+		print('Folder organization finished in', str(datetime.timedelta(seconds=time_ended - time_started)), '({0} added/updated, {1} removed)'.format(added, removed))
 
 def main():
 	if '--organize-folder' in sys.argv:
@@ -212,12 +263,9 @@ def main():
 		else:
 			missing_value = None
 
-		for root, _, files in os.walk(main_config.output_folder):
-			for f in files:
-				if f.endswith('.desktop'):
-					path = os.path.join(root, f)
-					desktop = launchers.get_desktop(path)
-					move_into_extra_subfolder(path, desktop, sanitize_name(name, supersafe=True), key, missing_value)
+		for path, desktop in launchers.get_launcher_store():
+			if path.endswith('.desktop'):
+				move_into_extra_subfolder(path, desktop, sanitize_name(name, supersafe=True), key, missing_value)
 		if main_config.print_times:
 			time_ended = time.perf_counter()
 			print('Folder organization finished in', str(datetime.timedelta(seconds=time_ended - time_started)))
@@ -141,3 +141,9 @@ helpers = {
 }
 
 generic_helper = add_generic_info
+
+#Hashes (besides the CRC32 that gets asked for anyway) that these helpers will want from RomFile.get_digest, so they can all be calculated while reading the ROM once
+wanted_digests = {
+	'Atari 2600': ('crc32', 'md5'),
+	'N64': ('crc32', 'md5', 'byteswapped_crc32'),
+}
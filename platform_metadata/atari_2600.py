@@ -1,4 +1,3 @@
-import hashlib
 import subprocess
 from enum import Enum, auto
 
@@ -6,7 +5,7 @@ import input_metadata
 import platform_metadata.atari_controllers as controllers
 from common_types import SaveType
 from info.region_info import TVSystem
-from software_list_info import find_in_software_lists, matcher_args_for_bytes
+from software_list_info import find_in_software_lists, matcher_args_for_rom
 
 from .atari_controllers import megadrive_pad
 
@@ -255,14 +254,13 @@ class StellaDB():
 def add_atari_2600_metadata(game):
 	stella_db = StellaDB.get_stella_db()
 
-	whole_cart = game.rom.read()
 	if stella_db:
-		md5 = hashlib.md5(whole_cart).hexdigest().lower()
+		md5 = game.rom.get_md5()
 		if md5 in stella_db:
 			game_info = stella_db[md5]
 			parse_stella_db(game.metadata, game_info)
 
-	software = find_in_software_lists(game.software_lists, matcher_args_for_bytes(whole_cart))
+	software = find_in_software_lists(game.software_lists, matcher_args_for_rom(game.rom))
 	if software:
 		existing_notes = game.metadata.specific_info.get('Notes')
 		software.add_standard_metadata(game.metadata)
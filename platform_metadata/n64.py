@@ -1,5 +1,4 @@
 import configparser
-import hashlib
 import os
 
 import input_metadata
@@ -92,9 +91,9 @@ def add_info_from_database_entry(metadata, database_entry):
 	#Unfortunately nothing in here which specifies to use VRU, or any other weird fancy controllers which may or may not exist
 
 def add_n64_metadata(game):
-	entire_rom = game.rom.read()
+	header = game.rom.read(amount=64)
 
-	magic = entire_rom[:4]
+	magic = header[:4]
 
 	is_byteswapped = False
 	if magic == b'\x80\x37\x12\x40':
@@ -107,7 +106,6 @@ def add_n64_metadata(game):
 		game.metadata.specific_info['ROM-Format'] = 'Unknown'
 		return
 
-	header = entire_rom[:64]
 	if is_byteswapped:
 		header = byteswap(header)
 
@@ -122,7 +120,7 @@ def add_n64_metadata(game):
 
 	database = get_mupen64plus_database()
 	if database:
-		rom_md5 = hashlib.md5(entire_rom).hexdigest().upper()
+		rom_md5 = game.rom.get_md5().upper()
 		database_entry = database.get(rom_md5)
 		if database_entry:
 			add_info_from_database_entry(game.metadata, database_entry)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import concurrent.futures
 import datetime
 import os
 import time
@@ -9,28 +10,43 @@ import mame_machines
 import scummvm
 import steam
 from config.main_config import main_config
-from launchers import get_desktop, get_field, id_section_name
+from launchers import get_field, get_launcher_store, id_section_name, save_launcher_store
+
+#Just to check if files exist, which is mostly waiting on the filesystem (especially if it's over a network), so there can be a lot of these
+_path_check_threads = 16
 
 def remove_nonexistent_games():
 	#If not doing a full rescan, we want to remove games that are no longer there
 
 	time_started = time.perf_counter()
 
-	output_folder = main_config.output_folder
-	for name in os.listdir(output_folder):
-		path = os.path.join(output_folder, name)
-
-		launcher = get_desktop(path)
+	store = get_launcher_store()
+	launchers = []
+	mame_ids = set()
+	paths_to_check = set()
+	for path, launcher in store:
 		game_type = get_field(launcher, 'Type', id_section_name)
 		game_id = get_field(launcher, 'Unique-ID', id_section_name)
+		launchers.append((path, game_type, game_id))
+		if game_type in ('MAME', 'Arcade', 'Inbuilt game'):
+			mame_ids.add(game_id)
+		elif game_type in ('ROM', 'DOS', 'GOG'):
+			paths_to_check.add(game_id)
+
+	#Get the slow stuff out of the way all at once first, rather than one launcher at a time
+	with concurrent.futures.ThreadPoolExecutor(_path_check_threads) as pool:
+		paths_to_check = list(paths_to_check)
+		nonexistent_paths = {game_id for game_id, exists in zip(paths_to_check, pool.map(os.path.exists, paths_to_check)) if not exists}
+		nonexistent_mame_ids = mame_machines.which_no_longer_exist(mame_ids) if mame_ids else set()
 
+	for path, game_type, game_id in launchers:
 		should_remove = False
 		if game_type in ('MAME', 'Arcade', 'Inbuilt game'):
-			should_remove = mame_machines.no_longer_exists(game_id)
-		elif game_type in 'ROM':
-			should_remove = not os.path.exists(game_id)
+			should_remove = game_id in nonexistent_mame_ids
+		elif game_type == 'ROM':
+			should_remove = game_id in nonexistent_paths
 		elif game_type == 'DOS':
-			should_remove = not os.path.exists(game_id)
+			should_remove = game_id in nonexistent_paths
 		elif game_type == 'Mac':
 			should_remove = mac.no_longer_exists(game_id)
 		elif game_type == 'ScummVM':
@@ -38,13 +54,13 @@ def remove_nonexistent_games():
 		elif game_type == 'Steam':
 			should_remove = steam.no_longer_exists(game_id)
 		elif game_type == 'GOG':
-			should_remove = not os.path.exists(game_id)
+			should_remove = game_id in nonexistent_paths
 		#Hmm, not sure what I should do if game_type is unrecognized. I guess ignore it, it might be from somewhere else and therefore not my business
 
 		if should_remove:
 			if main_config.debug:
 				print(game_type, game_id, 'no longer exists, removing')
-			os.remove(path)
+			store.remove(path)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -53,3 +69,4 @@ def remove_nonexistent_games():
 
 if __name__ == '__main__':
 	remove_nonexistent_games()
+	save_launcher_store()
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+
+from common_paths import cache_dir
+
+#Remembers what each folder in each ROM dir looked like last time, so if a folder's mtime hasn't changed (i.e. nothing was added, removed or renamed in it) we don't have to list it or look at anything in it again, which is most of the time spent on a rescan where nothing's changed (especially over a network)
+#Files that were changed in place don't change the folder's mtime, but those would have been skipped by has_been_done anyway
+
+snapshot_path = os.path.join(cache_dir, 'rom_dir_snapshot.json')
+
+#Some filesystems only store mtime to the nearest second or two, so if a folder was listed this soon after it was modified, something else could have been added in that same second without the mtime changing, and we shouldn't trust it next time
+_mtime_granularity_ns = 2 * 1000 * 1000 * 1000
+
+class FolderSnapshot():
+	def __init__(self, mtime, entry_count, subfolders, m3u_references, is_racy):
+		self.mtime = mtime
+		self.entry_count = entry_count
+		self.subfolders = subfolders
+		self.m3u_references = m3u_references #Everything listed in m3u files in this folder, as they still need to be excluded from other folders even when this one is skipped
+		self.is_racy = is_racy
+
+	def to_json(self):
+		return [self.mtime, self.entry_count, self.subfolders, self.m3u_references, self.is_racy]
+
+	@staticmethod
+	def from_json(data):
+		return FolderSnapshot(*data)
+
+	def is_unchanged(self, stat):
+		return not self.is_racy and stat.st_mtime_ns == self.mtime
+
+def make_folder_snapshot(stat, entry_count, subfolders, m3u_references):
+	is_racy = time.time_ns() - stat.st_mtime_ns < _mtime_granularity_ns
+	return FolderSnapshot(stat.st_mtime_ns, entry_count, subfolders, m3u_references, is_racy)
+
+class RomDirSnapshot():
+	def __init__(self, path):
+		self.path = path
+		self.old_systems = {}
+		self.new_systems = {}
+		try:
+			with open(path, 'rt', encoding='utf-8') as f:
+				self.old_systems = json.load(f)
+		except (OSError, ValueError):
+			pass
+
+	def get(self, system_name, fingerprint, folder):
+		system = self.old_systems.get(system_name)
+		if not system or system['fingerprint'] != fingerprint:
+			return None
+		folder_snapshot = system['folders'].get(folder)
+		if not folder_snapshot:
+			return None
+		return FolderSnapshot.from_json(folder_snapshot)
+
+	def put(self, system_name, fingerprint, folder, folder_snapshot):
+		system = self.new_systems.setdefault(system_name, {'fingerprint': fingerprint, 'folders': {}})
+		system['folders'][folder] = folder_snapshot.to_json()
+
+	def save(self):
+		#Systems that weren't scanned this time (--systems or --exclude) keep what they had
+		systems = dict(self.old_systems)
+		systems.update(self.new_systems)
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		temp_path = self.path + '.tmp'
+		with open(temp_path, 'wt', encoding='utf-8') as f:
+			json.dump(systems, f)
+		os.replace(temp_path, self.path)
+		self.old_systems = systems
+		self.new_systems = {}
+
+_rom_dir_snapshot = None
+def get_rom_dir_snapshot():
+	global _rom_dir_snapshot
+	if _rom_dir_snapshot is None:
+		_rom_dir_snapshot = RomDirSnapshot(snapshot_path)
+	return _rom_dir_snapshot
@@ -1,20 +1,26 @@
 #!/usr/bin/env python3
 
+import collections
 import datetime
+import hashlib
+import mmap
+import multiprocessing
 import os
 import pathlib
 import sys
-import tempfile
 import time
 import traceback
-from zlib import crc32
+import zlib
 
 import archives
 import cd_read
 import common
+import extraction_cache
+import hash_cache
 import io_utils
 import launchers
 import metadata
+import rom_dir_snapshot
 from common_types import (EmulationNotSupportedException,
                           ExtensionNotSupportedException, NotARomException)
 from config.emulator_config import emulator_configs
@@ -23,6 +29,10 @@ from config.system_config import system_configs
 from info import emulator_info, system_info
 from roms_metadata import add_metadata
 
+digest_names = ('crc32', 'headerless_crc32', 'byteswapped_crc32', 'md5', 'sha1')
+digest_chunk_size = 16 * 1024 * 1024
+extraction_cache_script = os.path.abspath(extraction_cache.__file__)
+
 class RomFile():
 	def __init__(self, path):
 		self.path = path
@@ -39,11 +49,13 @@ class RomFile():
 
 		self.extension = self.original_extension
 
+		self.archive = None
 		if self.original_extension in archives.compressed_exts:
 			self.is_compressed = True
+			self.archive = archives.ArchiveHandle(self.path)
 
 			found_file_already = False
-			for entry in archives.compressed_list(self.path):
+			for entry in self.archive.namelist():
 				if found_file_already:
 					self.warn_about_multiple_files = True
 					continue
@@ -60,51 +72,173 @@ class RomFile():
 			self.compressed_entry = None
 			self.name = name_without_extension
 			
+		#Nothing gets read until something actually asks for it, so files that get thrown away for having the wrong extension or already having a launcher cost nothing
+		self._has_loaded = False
 		self.store_entire_file = False
 		self.entire_file = b''
-		if self._get_size() < main_config.max_size_for_storing_in_memory:
-			self.store_entire_file = True
-			self.entire_file = self._read()
+		self._mmap = None
+		self._size = None
 
-		self.crc_for_database = None
 		self.header_length_for_crc_calculation = 0
+		self.wanted_digests = set()
+		self._digests = {}
+
+	def _load(self):
+		if self._has_loaded:
+			return
+		self._has_loaded = True
+		size = self._get_size()
+		if size < main_config.max_size_for_storing_in_memory or size == 0:
+			self.store_entire_file = True
+			self.entire_file = self._read()
+		elif not self.is_compressed:
+			#Map the whole thing once instead of opening and seeking again on every read(), since platform helpers tend to read a lot of little bits
+			with open(self.path, 'rb') as f:
+				self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def close(self):
+		#Otherwise every archive we look at keeps a file open until it gets garbage collected, which can be a lot of files at once with a big enough ROM folder
+		if self.archive:
+			self.archive.close()
+		if self._mmap is not None:
+			self._mmap.close()
+			self._mmap = None
+			self._has_loaded = False
 
 	def _read(self, seek_to=0, amount=-1):
-		return io_utils.read_file(self.path, self.compressed_entry, seek_to, amount)
+		if self.archive:
+			return self.archive.read_range(self.compressed_entry, seek_to, amount)
+		return io_utils.read_file(self.path, seek_to=seek_to, amount=amount)
 
 	def read(self, seek_to=0, amount=-1):
+		self._load()
 		if self.store_entire_file:
 			if amount == -1:
 				return self.entire_file[seek_to:]
 			return self.entire_file[seek_to: seek_to + amount]
+		if self._mmap is not None:
+			if amount == -1:
+				return self._mmap[seek_to:]
+			return self._mmap[seek_to: seek_to + amount]
 		return self._read(seek_to, amount)
 
+	def read_view(self, seek_to=0, amount=-1):
+		#Like read(), but gives back a memoryview without copying anything where possible, for things like hashing that just need to look at it
+		self._load()
+		if self.store_entire_file:
+			view = memoryview(self.entire_file)
+		elif self._mmap is not None:
+			view = memoryview(self._mmap)
+		else:
+			return memoryview(self._read(seek_to, amount))
+		if amount == -1:
+			return view[seek_to:]
+		return view[seek_to: seek_to + amount]
+
 	def _get_size(self):
-		return io_utils.get_real_size(self.path, self.compressed_entry)
+		if self._size is None:
+			self._size = self.archive.getsize(self.compressed_entry) if self.archive else io_utils.get_real_size(self.path)
+		return self._size
 
 	def get_size(self):
+		self._load()
 		if self.store_entire_file:
 			return len(self.entire_file)
 		return self._get_size()
 
-	def _get_crc32(self):
-		return io_utils.get_crc32(self.path, self.compressed_entry)
+	def _iter_chunks(self):
+		self._load()
+		if self.store_entire_file or self._mmap is not None:
+			view = self.read_view()
+			for i in range(0, len(view), digest_chunk_size):
+				yield view[i: i + digest_chunk_size]
+		elif self.archive:
+			yield from self.archive.iter_chunks(self.compressed_entry, digest_chunk_size)
+		else:
+			yield from io_utils.iter_chunks(self.path, digest_chunk_size)
+
+	def _compute_digests(self, names):
+		#Work out everything in names with one read through the file, rather than reading it again for each one
+		digests = {}
+		names = set(names)
+		if self.is_compressed and 'crc32' in names:
+			#Archives already know the CRC32 of what's in them, so don't bother decompressing just for that (_iter_chunks only loads the file if something else is still needed)
+			digests['crc32'] = self.archive.get_crc32(self.compressed_entry)
+			names.discard('crc32')
+		if not names:
+			return digests
+
+		header_length = self.header_length_for_crc_calculation
+		crc = 0
+		headerless_crc = 0
+		byteswapped_crc = 0
+		md5 = hashlib.md5() if 'md5' in names else None
+		sha1 = hashlib.sha1() if 'sha1' in names else None
+
+		position = 0
+		for chunk in self._iter_chunks():
+			if 'crc32' in names:
+				crc = zlib.crc32(chunk, crc)
+			if 'headerless_crc32' in names and position + len(chunk) > header_length:
+				headerless_crc = zlib.crc32(chunk[max(header_length - position, 0):], headerless_crc)
+			if 'byteswapped_crc32' in names:
+				#digest_chunk_size is even, so only the last chunk can have an odd byte out, which has nothing to swap with
+				byteswapped_crc = zlib.crc32(common.byteswap(chunk[:len(chunk) & ~1]), byteswapped_crc)
+				if len(chunk) & 1:
+					byteswapped_crc = zlib.crc32(chunk[-1:], byteswapped_crc)
+			if md5:
+				md5.update(chunk)
+			if sha1:
+				sha1.update(chunk)
+			position += len(chunk)
+
+		if 'crc32' in names:
+			digests['crc32'] = crc & 0xffffffff
+		if 'headerless_crc32' in names:
+			digests['headerless_crc32'] = headerless_crc & 0xffffffff
+		if 'byteswapped_crc32' in names:
+			digests['byteswapped_crc32'] = byteswapped_crc & 0xffffffff
+		if md5:
+			digests['md5'] = md5.hexdigest()
+		if sha1:
+			digests['sha1'] = sha1.hexdigest()
+		return digests
+
+	def _digest_key(self, name):
+		#headerless_crc32 is just a CRC32 with the header skipped, and that's how the hash cache stores it too (along with how long the header is)
+		if name == 'headerless_crc32':
+			return self.header_length_for_crc_calculation, 'crc32'
+		return 0, name
+
+	def get_digest(self, name):
+		#name is one of digest_names; anything in wanted_digests we don't already know gets worked out in the same read
+		key = self._digest_key(name)
+		if key not in self._digests:
+			needed = {}
+			for digest_name in {name} | self.wanted_digests:
+				digest_key = self._digest_key(digest_name)
+				if digest_key in self._digests:
+					continue
+				cached = hash_cache.get_cached_hash(self.path, self.compressed_entry, *digest_key)
+				if cached is not None:
+					self._digests[digest_key] = cached
+				else:
+					needed[digest_name] = digest_key
+
+			if needed:
+				for digest_name, value in self._compute_digests(needed).items():
+					self._digests[needed[digest_name]] = value
+					hash_cache.store_hash(self.path, self.compressed_entry, *needed[digest_name], value)
+		return self._digests[key]
 
 	def get_crc32(self):
-		if self.crc_for_database:
-			return self.crc_for_database
-		
 		if self.header_length_for_crc_calculation > 0:
-			crc = crc32(self.read(seek_to=self.header_length_for_crc_calculation)) & 0xffffffff
-			self.crc_for_database = crc
-			return crc
+			return self.get_digest('headerless_crc32')
+		return self.get_digest('crc32')
 
-		if self.store_entire_file:
-			crc = crc32(self.entire_file) & 0xffffffff
-		else:
-			crc = self._get_crc32()
-		self.crc_for_database = crc
-		return crc
+	def get_md5(self):
+		#Lowercase hex, like hashlib gives us
+		return self.get_digest('md5')
 
 class GCZRomFile(RomFile):
 	def read(self, seek_to=0, amount=-1):
@@ -137,12 +271,12 @@ class RomGame():
 		params = self.launch_params
 
 		if self.rom.is_compressed and (self.rom.original_extension not in self.emulator.supported_compression):
-			temp_extraction_folder = os.path.join(tempfile.gettempdir(), 'meow-launcher-' + launchers.make_filename(self.rom.name))
+			#Gets extracted into the extraction cache (or reused from there if it's already been extracted) by extraction_cache.py when launched, which then runs the emulator, so it knows not to delete it while that's still going
+			extraction_folder = extraction_cache.get_extraction_folder(self.rom.path, launchers.make_filename(self.rom.name))
 
-			extracted_path = os.path.join(temp_extraction_folder, self.rom.compressed_entry)
+			extracted_path = os.path.join(extraction_folder, self.rom.compressed_entry)
 			params = params.replace_path_argument(extracted_path)
-			params = params.prepend_command(launchers.LaunchParams('7z', ['x', '-o' + temp_extraction_folder, self.rom.path]))
-			params = params.append_command(launchers.LaunchParams('rm', ['-rf', temp_extraction_folder]))
+			params = launchers.LaunchParams(sys.executable, [extraction_cache_script, self.rom.path, extraction_folder, 'sh', '-c', params.make_linux_command_string()], working_directory=params.working_directory)
 		else:
 			params = params.replace_path_argument(self.rom.path)
 
@@ -159,7 +293,14 @@ def try_emulator(game, emulator, system_config, emulator_config):
 
 def process_file(system_config, rom_dir, root, rom):
 	game = RomGame(rom, system_config.name, system_info.systems[system_config.name], root)
-
+	try:
+		_process_game(system_config, rom_dir, root, game)
+	finally:
+		for subrom in game.subroms or ():
+			subrom.close()
+
+def _process_game(system_config, rom_dir, root, game):
+	rom = game.rom
 	if game.rom.extension == 'm3u':
 		lines = game.rom.read().decode('utf-8').splitlines()
 		filenames = [line if line.startswith('/') else os.path.join(game.folder, line) for line in lines if not line.startswith("#")]
@@ -226,70 +367,138 @@ def parse_m3u(path):
 	with open(path, 'rt') as f:
 		return [line.rstrip('\n') for line in f]
 
-def sort_m3u_first():
-	class Sorter:
-		def __init__(self, obj, *_):
-			self.o = obj
-		def __lt__(self, other):
-			return self.o.lower().endswith('.m3u')
-		def __le__(self, other):
-			return self.o.lower().endswith('.m3u')
-		def __gt__(self, other):
-			return other.lower().endswith('.m3u')
-		def __ge__(self, other):
-			return other.lower().endswith('.m3u')
-
-	return Sorter
+def _get_m3u_references(m3u_path):
+	#Lines in an m3u are relative to the folder it's in (unless they're absolute, in which case os.path.join leaves them alone)
+	folder = os.path.dirname(m3u_path)
+	return {os.path.normpath(os.path.join(folder, line)) for line in parse_m3u(m3u_path) if line and not line.startswith('#')}
 
-def process_emulated_system(system_config):
-	time_started = time.perf_counter()
+def _is_m3u(name):
+	return name.rsplit(os.extsep, 1)[-1].lower() == 'm3u'
 
+def _warn_about_invalid_emulators(system_config):
 	for emulator_name in system_config.chosen_emulators:
 		if emulator_name not in emulator_info.emulators:
 			print('Config warning:', emulator_name, 'is not a valid emulator')
 		elif emulator_name not in system_info.systems[system_config.name].emulators:
 			print('Config warning:', emulator_name, 'is not a valid emulator for', system_config.name)
 
-	for rom_dir in system_config.paths:
-		used_m3u_filenames = []
-		if not os.path.isdir(rom_dir):
-			print('Oh no', system_config.name, 'has invalid ROM dir', rom_dir)
+def _get_snapshot_fingerprint(system_config):
+	#If any of this changes, what we skipped or didn't skip last time might be different now, so the snapshot of this system's folders can't be trusted
+	return repr((main_config.output_folder, system_config.paths, system_config.chosen_emulators, sorted(system_config.options.items(), key=lambda option: option[0]), main_config.ignored_directories, main_config.skipped_subfolder_names))
+
+def get_rom_dir_manifest(system_config, rom_dir):
+	#Returns [(root, filenames)] for each folder in rom_dir, in the order they should be processed, skipping over anything we know we don't need to look at without having to open it
+	#Everything gets listed first and then filtered, so a multi-disc game's m3u excludes the individual discs no matter which folder either of them are in or which gets looked at first
+	snapshot = rom_dir_snapshot.get_rom_dir_snapshot()
+	fingerprint = _get_snapshot_fingerprint(system_config)
+	#If there aren't any launchers at all, the output folder must have been emptied since last time, so everything needs to be made again
+	can_skip_unchanged_folders = main_config.skip_unchanged_folders and not main_config.full_rescan and launchers.get_existing_launchers().has_any_of_type('ROM')
+	skipped_folder_count = 0
+	skipped_entry_count = 0
+
+	m3u_references = set()
+	listed_folders = []
+	#Goes through everything in the same order as os.walk would
+	folders = [rom_dir]
+	while folders:
+		root = folders.pop()
+		try:
+			stat = os.stat(root)
+		except OSError:
+			continue
+
+		previous_snapshot = snapshot.get(system_config.name, fingerprint, root) if can_skip_unchanged_folders else None
+		if previous_snapshot and previous_snapshot.is_unchanged(stat):
+			#Nothing's been added or removed here, so everything in here was already looked at last time
+			snapshot.put(system_config.name, fingerprint, root, previous_snapshot)
+			m3u_references.update(previous_snapshot.m3u_references)
+			folders.extend(os.path.join(root, subfolder) for subfolder in reversed(previous_snapshot.subfolders))
+			skipped_folder_count += 1
+			skipped_entry_count += previous_snapshot.entry_count
+			continue
+
+		files = []
+		subfolders = []
+		try:
+			with os.scandir(root) as it:
+				for entry in it:
+					if entry.is_dir():
+						#os.walk doesn't follow symlinks to folders by default, so neither do we
+						if not entry.is_symlink():
+							subfolders.append(entry.name)
+					else:
+						files.append(entry.name)
+		except OSError:
 			continue
-		for root, _, files in os.walk(rom_dir):
-			if common.starts_with_any(root + os.sep, main_config.ignored_directories):
+
+		folder_m3u_references = set()
+		is_skipped = common.starts_with_any(root + os.sep, main_config.ignored_directories)
+		if not is_skipped:
+			subfolder_parts = list(pathlib.Path(root).relative_to(rom_dir).parts)
+			is_skipped = bool(subfolder_parts) and subfolder_parts[0] in main_config.skipped_subfolder_names
+		if not is_skipped:
+			for name in files:
+				if _is_m3u(name):
+					folder_m3u_references.update(_get_m3u_references(os.path.join(root, name)))
+			m3u_references.update(folder_m3u_references)
+			listed_folders.append((root, files))
+
+		snapshot.put(system_config.name, fingerprint, root, rom_dir_snapshot.make_folder_snapshot(stat, len(files) + len(subfolders), subfolders, sorted(folder_m3u_references)))
+		folders.extend(os.path.join(root, subfolder) for subfolder in reversed(subfolders))
+
+	if main_config.print_times and skipped_folder_count:
+		print(system_config.name, 'skipped', skipped_folder_count, 'unchanged folders containing', skipped_entry_count, 'files/folders in', rom_dir)
+
+	manifest = []
+	for root, files in listed_folders:
+		#m3u files go first, since they're what the rest of the discs are played with
+		names = [name for name in files if _is_m3u(name)]
+		#Avoid adding part of a multi-disc game if we've already added the whole thing via m3u
+		names += [name for name in files if not _is_m3u(name) and os.path.normpath(os.path.join(root, name)) not in m3u_references]
+		if names:
+			manifest.append((root, names))
+	return manifest
+
+def process_rom_files(system_config, rom_dir, root, names):
+	system = system_info.systems[system_config.name]
+	for name in names:
+		path = os.path.join(root, name)
+
+		extension = name.rsplit(os.extsep, 1)[1].lower() if os.extsep in name else None
+		if extension not in archives.compressed_exts and extension != 'm3u':
+			#We can tell this isn't something we want from the filename alone, so don't bother looking at it any further
+			if not system.is_valid_file_type(extension):
+				continue
+
+		if not main_config.full_rescan:
+			if launchers.has_been_done('ROM', path):
 				continue
-			subfolders = list(pathlib.Path(root).relative_to(rom_dir).parts)
-			if subfolders:
-				if subfolders[0] in main_config.skipped_subfolder_names:
+
+		rom = rom_file(path)
+		try:
+			if rom.extension != 'm3u':
+				if not system.is_valid_file_type(rom.extension):
 					continue
 
-			for name in sorted(files, key=sort_m3u_first()):
-				path = os.path.join(root, name)
+			process_file(system_config, rom_dir, root, rom)
+		#pylint: disable=broad-except
+		except Exception as ex:
+			#It would be annoying to have the whole program crash because there's an error with just one ROM… maybe. This isn't really expected to happen, but I guess there's always the possibility of "oh no the user's hard drive exploded" or some other error that doesn't really mean I need to fix something, either, but then I really do need the traceback for when this does happen
+			print('FUCK!!!!', path, ex, type(ex), traceback.extract_tb(ex.__traceback__)[1:])
+		finally:
+			rom.close()
+
+def process_emulated_system(system_config):
+	time_started = time.perf_counter()
 
-				rom = rom_file(path)
+	_warn_about_invalid_emulators(system_config)
 
-				if rom.extension == 'm3u':
-					used_m3u_filenames.extend(parse_m3u(path))
-				else:
-					#Avoid adding part of a multi-disc game if we've already added the whole thing via m3u
-					#This is why we have to make sure m3u files are added first, though...  not really a nice way around this, unless we scan the whole directory for files first and then rule out stuff?
-					if name in used_m3u_filenames or path in used_m3u_filenames:
-						continue
-
-					system = system_info.systems[system_config.name]
-					if not system.is_valid_file_type(rom.extension):
-						continue
-
-				if not main_config.full_rescan:
-					if launchers.has_been_done('ROM', path):
-						continue
-
-				try:
-					process_file(system_config, rom_dir, root, rom)
-				#pylint: disable=broad-except
-				except Exception as ex:
-					#It would be annoying to have the whole program crash because there's an error with just one ROM… maybe. This isn't really expected to happen, but I guess there's always the possibility of "oh no the user's hard drive exploded" or some other error that doesn't really mean I need to fix something, either, but then I really do need the traceback for when this does happen
-					print('FUCK!!!!', path, ex, type(ex), traceback.extract_tb(ex.__traceback__)[1:])
+	for rom_dir in system_config.paths:
+		if not os.path.isdir(rom_dir):
+			print('Oh no', system_config.name, 'has invalid ROM dir', rom_dir)
+			continue
+		for root, names in get_rom_dir_manifest(system_config, rom_dir):
+			process_rom_files(system_config, rom_dir, root, names)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -302,6 +511,69 @@ def process_system(system_config):
 		#Let DOS and Mac fall through, as those are in systems.ini but not handled here
 		return
 
+#Folders with a lot of files in them get split up into several work units of this many files, so one huge folder doesn't end up stuck on one core
+_max_files_per_work_unit = 64
+
+def _get_work_units(system_configs_to_process):
+	work_units = []
+	for system_config in system_configs_to_process:
+		_warn_about_invalid_emulators(system_config)
+		for rom_dir in system_config.paths:
+			if not os.path.isdir(rom_dir):
+				print('Oh no', system_config.name, 'has invalid ROM dir', rom_dir)
+				continue
+			for root, names in get_rom_dir_manifest(system_config, rom_dir):
+				for i in range(0, len(names), _max_files_per_work_unit):
+					work_units.append((system_config.name, rom_dir, root, names[i:i + _max_files_per_work_unit]))
+	return work_units
+
+def _init_scan_worker(existing_launchers):
+	launchers.use_existing_launchers(existing_launchers)
+	launchers.defer_launchers()
+
+def _process_work_unit(work_unit):
+	time_started = time.perf_counter()
+	system_name, rom_dir, root, names = work_unit
+	process_rom_files(system_configs[system_name], rom_dir, root, names)
+	return launchers.take_deferred_launchers(), time.perf_counter() - time_started
+
+def process_systems_in_parallel(system_configs_to_process, jobs):
+	#Workers only figure out what the launchers should be, and the main process writes them all out in the same order as process_emulated_system would have; that way pick_new_filename gives everything the same filename as a serial run would
+	existing_launchers = None if main_config.full_rescan else launchers.get_existing_launchers()
+	emulated_system_configs = [system_config for system_config in system_configs_to_process if system_config.name in system_info.systems]
+
+	work_units = _get_work_units(emulated_system_configs)
+	if main_config.print_times:
+		print('Scanning', sum(len(work_unit[3]) for work_unit in work_units), 'files in', len(work_units), 'work units')
+
+	#Systems' work units overlap with each other, so instead of how long each one took from start to finish, this adds up how long the jobs spent on each one
+	work_units_left = collections.Counter(work_unit[0] for work_unit in work_units)
+	time_taken = collections.Counter()
+	if main_config.print_times:
+		for system_config in emulated_system_configs:
+			if not work_units_left[system_config.name]:
+				print(system_config.name, 'finished in', str(datetime.timedelta(seconds=0)))
+
+	with multiprocessing.Pool(jobs, initializer=_init_scan_worker, initargs=(existing_launchers, )) as pool:
+		for work_unit, (deferred_launchers, work_unit_time) in zip(work_units, pool.imap(_process_work_unit, work_units)):
+			for launch_params, display_name, fields in deferred_launchers:
+				launchers.make_linux_desktop(launch_params, display_name, fields)
+
+			system_name = work_unit[0]
+			time_taken[system_name] += work_unit_time
+			work_units_left[system_name] -= 1
+			if main_config.print_times and not work_units_left[system_name]:
+				print(system_name, 'finished in', str(datetime.timedelta(seconds=time_taken[system_name])), '(total time across all jobs)')
+
+def process_system_list(system_configs_to_process):
+	if main_config.jobs > 1:
+		process_systems_in_parallel(system_configs_to_process, main_config.jobs)
+	else:
+		for system_config in system_configs_to_process:
+			process_system(system_config)
+	#Only once everything's been processed, otherwise if something goes wrong halfway through, the folders that didn't get processed would be skipped next time
+	rom_dir_snapshot.get_rom_dir_snapshot().save()
+
 def process_systems():
 	time_started = time.perf_counter()
 
@@ -310,12 +582,7 @@ def process_systems():
 		if arg.startswith('--exclude='):
 			excluded_systems.append(arg.partition('=')[2])
 
-	for system_name, system in system_configs.items():
-		if system_name in excluded_systems:
-			continue
-		if not system.is_available:
-			continue
-		process_system(system)
+	process_system_list([system for system_name, system in system_configs.items() if system_name not in excluded_systems and system.is_available])
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -340,8 +607,7 @@ def main():
 			return
 
 		system_list = sys.argv[arg_index + 1].split(',')
-		for system_name in system_list:
-			process_system(system_configs[system_name])
+		process_system_list([system_configs[system_name] for system_name in system_list])
 		return
 
 	process_systems()
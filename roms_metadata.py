@@ -238,6 +238,7 @@ def add_metadata_from_libretro_database(game):
 
 
 def add_metadata(game):
+	game.rom.wanted_digests.update(platform_metadata.wanted_digests.get(game.system_name, ()))
 	add_alternate_names(game.rom, game.metadata)
 	#I guess if game.subroms was ever used you would loop through each one (I swear I will do the thing one day)
 
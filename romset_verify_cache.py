@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from common_paths import cache_dir
+from config.main_config import main_config
+from mame_helpers import (MAMENotInstalledException, default_mame_executable,
+                          get_cached_mame_xml, get_mame_core_config,
+                          verify_romsets as verify_romsets_with_mame)
+
+#Remembers what -verifyroms said about each romset between runs, since running it is the slowest part of doing MAME machines by far
+#Entries are only trusted if it's the same MAME version, and every file that romset needs (its own, its parent's and BIOS's, and any devices it has) still has the same size and mtime as it did when it was verified
+
+romset_verify_cache_path = os.path.join(cache_dir, 'verified_romsets.db')
+romset_extensions = ('zip', '7z')
+
+class RomsetVerifyCache():
+	def __init__(self, path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		#Each scan worker process has its own connection, so let them wait on each other rather than erroring out
+		self.connection = sqlite3.connect(path, timeout=60)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute('''CREATE TABLE IF NOT EXISTS verified_romsets (
+			basename TEXT PRIMARY KEY,
+			mame_version TEXT NOT NULL,
+			fingerprint TEXT NOT NULL,
+			is_good INTEGER NOT NULL
+		)''')
+		self.connection.commit()
+
+	def get(self, basename, mame_version, fingerprint):
+		row = self.connection.execute('SELECT mame_version, fingerprint, is_good FROM verified_romsets WHERE basename = ?', (basename, )).fetchone()
+		if not row:
+			return None
+		if row[0] != mame_version or row[1] != fingerprint:
+			return None
+		return bool(row[2])
+
+	def put(self, basename, mame_version, fingerprint, is_good):
+		self.connection.execute('INSERT OR REPLACE INTO verified_romsets VALUES (?, ?, ?, ?)', (basename, mame_version, fingerprint, is_good))
+
+	def commit(self):
+		self.connection.commit()
+
+_romset_verify_cache = None
+_romset_verify_cache_pid = None
+def get_romset_verify_cache():
+	global _romset_verify_cache, _romset_verify_cache_pid
+	#sqlite3 connections can't be shared with forked processes, so make a new one if we've ended up in a worker
+	if _romset_verify_cache is None or _romset_verify_cache_pid != os.getpid():
+		_romset_verify_cache = RomsetVerifyCache(romset_verify_cache_path)
+		_romset_verify_cache_pid = os.getpid()
+	return _romset_verify_cache
+
+_direct_dependencies = {}
+def _get_direct_dependencies(basename):
+	if basename not in _direct_dependencies:
+		machine_xml = get_cached_mame_xml(basename)
+		if machine_xml is None:
+			return None
+		names = [machine_xml.attrib.get('romof')] + [device_ref.attrib.get('name') for device_ref in machine_xml.findall('device_ref')]
+		_direct_dependencies[basename] = tuple(name for name in names if name)
+	return _direct_dependencies[basename]
+
+def get_dependencies(basename):
+	#Everything -verifyroms would end up looking at for this romset; or None if we don't know that yet because we haven't got the whole -listxml
+	if _get_direct_dependencies(basename) is None:
+		return None
+	dependencies = {basename}
+	to_check = [basename]
+	while to_check:
+		for name in _get_direct_dependencies(to_check.pop()) or ():
+			if name not in dependencies:
+				dependencies.add(name)
+				to_check.append(name)
+	return dependencies
+
+def _stat_romset_files(rompaths, basename):
+	files = []
+	for rompath in rompaths:
+		for extension in romset_extensions:
+			path = os.path.join(rompath, basename + os.extsep + extension)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			files.append((path, stat.st_size, stat.st_mtime_ns))
+		#Loose files or CHDs
+		folder = os.path.join(rompath, basename)
+		try:
+			entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+		except OSError:
+			continue
+		for entry in entries:
+			try:
+				stat = entry.stat()
+			except OSError:
+				continue
+			files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+	return files
+
+def get_fingerprint(rompaths, basename, file_stats):
+	dependencies = get_dependencies(basename)
+	if dependencies is None:
+		return None
+	files = []
+	for name in sorted(dependencies):
+		if name not in file_stats:
+			file_stats[name] = _stat_romset_files(rompaths, name)
+		files.append((name, file_stats[name]))
+	return hashlib.sha1(json.dumps(files).encode('utf-8', errors='surrogateescape')).hexdigest()
+
+def _get_rompaths():
+	#None if there's nowhere to look, since then every romset would get the same fingerprint no matter what's changed
+	try:
+		rompaths = get_mame_core_config().get('rompath')
+	except MAMENotInstalledException:
+		return None
+	if not rompaths:
+		return None
+	#MAME expands environment variables in these (Debian's default is $HOME/mame/roms), so we need to as well
+	rompaths = [os.path.expanduser(os.path.expandvars(rompath)) for rompath in rompaths]
+	rompaths = [rompath for rompath in rompaths if os.path.isdir(rompath)]
+	return rompaths or None
+
+def verify_romsets(basenames):
+	#basename -> bool, same as mame_helpers.verify_romsets, but only actually asks MAME about the ones that have changed since last time
+	basenames = list(dict.fromkeys(basenames))
+	rompaths = _get_rompaths()
+	if not main_config.use_romset_verify_cache or not rompaths:
+		#If we don't know where the ROMs are, we can't tell if they've changed
+		return verify_romsets_with_mame(basenames)
+
+	cache = get_romset_verify_cache()
+	mame_version = default_mame_executable.version
+	file_stats = {} #Lots of romsets will have the same parent/BIOS/devices, so don't look for those files over and over again
+
+	results = {}
+	fingerprints = {}
+	for basename in basenames:
+		fingerprint = get_fingerprint(rompaths, basename, file_stats)
+		if fingerprint:
+			is_good = cache.get(basename, mame_version, fingerprint)
+			if is_good is not None:
+				results[basename] = is_good
+				continue
+		fingerprints[basename] = fingerprint
+
+	for basename, is_good in verify_romsets_with_mame(list(fingerprints)).items():
+		results[basename] = is_good
+		if fingerprints[basename]:
+			cache.put(basename, mame_version, fingerprints[basename], is_good)
+	cache.commit()
+
+	return {basename: results[basename] for basename in basenames}
+
+def verify_romset(basename):
+	return verify_romsets([basename])[basename]
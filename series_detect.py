@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import datetime
-import os
 import re
 import time
 
@@ -60,21 +59,31 @@ def find_series_from_game_name(name):
 		return chapter_matcher.sub('', series_name).rstrip(), number
 	return None, None
 
-def does_series_match(name_to_match, existing_series):
-	name_to_match = name_to_match.lower()
-	existing_series = existing_series.lower()
+def normalize_series_name(name):
+	name = name.lower()
 
-	if name_to_match.startswith('the '):
-		name_to_match = name_to_match[len('the '):]
+	if name.startswith('the '):
+		name = name[len('the '):]
 
 	for suffix in suffixes_not_part_of_series:
-		if name_to_match.endswith(' ' + suffix):
-			name_to_match = name_to_match[:-len(' ' + suffix)]
+		if name.endswith(' ' + suffix):
+			name = name[:-len(' ' + suffix)]
 			break
 
 	#Might also want to remove punctuation
 
-	return name_to_match == existing_series
+	return name
+
+class SeriesIndex():
+	#Existing series names, looked up by the lowercase version, so matching a name against all of them is just a dict lookup
+	def __init__(self):
+		self.serieses = {}
+
+	def add(self, series):
+		self.serieses.setdefault(series.lower(), series)
+
+	def find(self, name_to_match):
+		return self.serieses.get(normalize_series_name(name_to_match))
 
 def find_series_name_by_subtitle(name, existing_serieses, force=False):
 	name_chunks = get_name_chunks(name)
@@ -87,10 +96,7 @@ def find_series_name_by_subtitle(name, existing_serieses, force=False):
 	if force:
 		match = name_chunk
 	else:
-		for existing_series in existing_serieses:
-			if does_series_match(name_chunk, existing_series):
-				match = existing_series
-				break
+		match = existing_serieses.find(name_chunk)
 
 	if match:
 		series = remove_capital_article(match)
@@ -110,15 +116,14 @@ def get_usable_name(desktop):
 	#Name _must_ exist in a .desktop file... although this is platform-specific, come to think of it, maybe I should put stuff in launchers.py to abstract getting name/exec/icon/etc
 	return launchers.get_field(desktop, 'Name', 'Desktop Entry')
 
-def add_series(desktop, path, series, series_index=None):
+def add_series(desktop, _, series, series_index=None):
+	#Gets written out later by launchers.save_launcher_store
 	if launchers.metadata_section_name not in desktop:
 		desktop.add_section(launchers.metadata_section_name)
 	if series is not None:
 		desktop[launchers.metadata_section_name]['Series'] = series
 	if series_index is not None:
 		desktop[launchers.metadata_section_name]['Series-Index'] = str(series_index)
-	with open(path, 'wt') as f:
-		desktop.write(f)
 
 def detect_series(desktop, path):
 	name = get_usable_name(desktop)
@@ -126,18 +131,6 @@ def detect_series(desktop, path):
 	if series:
 		add_series(desktop, path, series, series_index)
 
-def find_existing_serieses():
-	serieses = set()
-	for name in os.listdir(main_config.output_folder):
-		path = os.path.join(main_config.output_folder, name)
-		desktop = launchers.get_desktop(path)
-
-		series = launchers.get_field(desktop, 'Series')
-		if series:
-			serieses.add(series)
-
-	return serieses
-
 def detect_series_by_subtitle(desktop, path, existing):
 	name = get_usable_name(desktop)
 	series, index = find_series_name_by_subtitle(name, existing)
@@ -166,72 +159,62 @@ def get_series_from_whole_thing(series, whole_name):
 	
 	return '1'
 
-def detect_series_index_for_things_with_series():
-	for filename in os.listdir(main_config.output_folder):
-		path = os.path.join(main_config.output_folder, filename)
-		desktop = launchers.get_desktop(path)
-
-		existing_series = launchers.get_field(desktop, 'Series')
-		if not existing_series:
-			continue
+def detect_series_index(desktop, path):
+	existing_series = launchers.get_field(desktop, 'Series')
+	if not existing_series:
+		return
 
-		if launchers.get_field(desktop, 'Series-Index'):
-			continue
+	if launchers.get_field(desktop, 'Series-Index'):
+		return
 
-		name = get_usable_name(desktop)
-		if name.startswith('The '):
-			name = name[len('The '):]
-		name_chunks = get_name_chunks(name)
-		if len(name_chunks) > 1:
-			if name_chunks[0] == existing_series:
-				series_index = name_chunks[1]
-				series_index = chapter_matcher.sub('', series_index).strip()
-				series_index = convert_roman_numerals_in_title(series_index)
-				add_series(desktop, path, None, series_index)
-			elif name_chunks[0].startswith(existing_series):
-				series_index = get_series_from_whole_thing(existing_series, name_chunks[0].strip())
-				add_series(desktop, path, None, series_index)
-			else:
-				#This handles the case where it's like "Blah Bloo - Chapter Zabityzoo" but the series in Steam is listed as some abbreviation/alternate spelling of Blah Bloo so it doesn't get picked up otherwise
-				chapter_index = None
-				try:
-					chapter_index = name.index('Ch.') + len('Ch.')
-				except ValueError:
-					chapter_matcherooni = chapter_matcher.search(name)
-					if chapter_matcherooni:
-						chapter_index = chapter_matcherooni.end()
-				if chapter_index is not None:
-					#Could also do just a word match starting from chapter_index I guess
-					add_series(desktop, path, None, convert_roman_numerals_in_title(name[chapter_index:].strip()))
-		elif len(name_chunks) == 1:
-			if name_chunks[0].startswith(existing_series):
-				add_series(desktop, path, None, get_series_from_whole_thing(existing_series, name_chunks[0].strip()))
-
-def get_existing_seriesless_launchers():
-	for name in os.listdir(main_config.output_folder):
-		path = os.path.join(main_config.output_folder, name)
-		desktop = launchers.get_desktop(path)
-
-		if launchers.get_field(desktop, 'Series'):
-			#Don't need to do this if it already exists
-			continue
-
-		yield desktop, path
+	name = get_usable_name(desktop)
+	if name.startswith('The '):
+		name = name[len('The '):]
+	name_chunks = get_name_chunks(name)
+	if len(name_chunks) > 1:
+		if name_chunks[0] == existing_series:
+			series_index = name_chunks[1]
+			series_index = chapter_matcher.sub('', series_index).strip()
+			series_index = convert_roman_numerals_in_title(series_index)
+			add_series(desktop, path, None, series_index)
+		elif name_chunks[0].startswith(existing_series):
+			series_index = get_series_from_whole_thing(existing_series, name_chunks[0].strip())
+			add_series(desktop, path, None, series_index)
+		else:
+			#This handles the case where it's like "Blah Bloo - Chapter Zabityzoo" but the series in Steam is listed as some abbreviation/alternate spelling of Blah Bloo so it doesn't get picked up otherwise
+			chapter_index = None
+			try:
+				chapter_index = name.index('Ch.') + len('Ch.')
+			except ValueError:
+				chapter_matcherooni = chapter_matcher.search(name)
+				if chapter_matcherooni:
+					chapter_index = chapter_matcherooni.end()
+			if chapter_index is not None:
+				#Could also do just a word match starting from chapter_index I guess
+				add_series(desktop, path, None, convert_roman_numerals_in_title(name[chapter_index:].strip()))
+	elif len(name_chunks) == 1:
+		if name_chunks[0].startswith(existing_series):
+			add_series(desktop, path, None, get_series_from_whole_thing(existing_series, name_chunks[0].strip()))
 
 def detect_series_for_all_desktops():
 	time_started = time.perf_counter()
 
-	for desktop, path in get_existing_seriesless_launchers():
-		detect_series(desktop, path)
-	existing = find_existing_serieses()
-	for desktop, path in get_existing_seriesless_launchers():
-		detect_series_by_subtitle(desktop, path, existing)
+	#The store is already all in memory, so everything that can be done one launcher at a time is; the only thing that needs all of them is knowing every series that exists before matching subtitles against them
+	store = list(launchers.get_launcher_store())
+	existing = SeriesIndex()
+	for path, desktop in store:
+		if not launchers.get_field(desktop, 'Series'):
+			detect_series(desktop, path)
+		series = launchers.get_field(desktop, 'Series')
+		if series:
+			existing.add(series)
 
-	for desktop, path in get_existing_seriesless_launchers():
-		if launchers.get_field(desktop, 'Series-Index'):
+	for path, desktop in store:
+		if not launchers.get_field(desktop, 'Series'):
+			detect_series_by_subtitle(desktop, path, existing)
+		if not launchers.get_field(desktop, 'Series') and launchers.get_field(desktop, 'Series-Index'):
 			force_add_series_with_index(desktop, path, existing)
-
-	detect_series_index_for_things_with_series()
+		detect_series_index(desktop, path)
 
 	if main_config.print_times:
 		time_ended = time.perf_counter()
@@ -239,3 +222,4 @@ def detect_series_for_all_desktops():
 
 if __name__ == '__main__':
 	detect_series_for_all_desktops()
+	launchers.save_launcher_store()
@@ -0,0 +1,429 @@
+import lzma
+import zlib
+
+#Reads the file list out of a 7z archive without having to run 7z, which is a lot faster when all we want is the names, sizes and CRCs
+#See https://fastapi.metacpan.org/source/BJOERN/Compress-Deflate7-1.0/7zip/DOC/7zFormat.txt for what all this is
+
+signature = b'7z\xbc\xaf\x27\x1c'
+
+#Property IDs
+k_end = 0x00
+k_header = 0x01
+k_archive_properties = 0x02
+k_additional_streams_info = 0x03
+k_main_streams_info = 0x04
+k_files_info = 0x05
+k_pack_info = 0x06
+k_unpack_info = 0x07
+k_substreams_info = 0x08
+k_size = 0x09
+k_crc = 0x0a
+k_folder = 0x0b
+k_coders_unpack_size = 0x0c
+k_num_unpack_stream = 0x0d
+k_empty_stream = 0x0e
+k_empty_file = 0x0f
+k_name = 0x11
+k_win_attributes = 0x15
+k_encoded_header = 0x17
+
+file_attribute_directory = 0x10
+#If this is set in the attributes, the high 16 bits are Unix st_mode
+file_attribute_unix_extension = 0x8000
+
+class SevenZipHeaderException(Exception):
+	#Anything we don't understand (encrypted headers, weird coders, etc) ends up here, and then whoever called us can just use 7z instead
+	pass
+
+class SevenZipEntry():
+	def __init__(self, name, size, crc32, attributes, is_directory):
+		self.name = name
+		self.size = size
+		self.crc32 = crc32 #None if the archive doesn't store one
+		self.attributes = attributes
+		self.is_directory = is_directory
+
+class _Folder():
+	def __init__(self):
+		self.coders = [] #(codec ID, number of in streams, number of out streams, properties)
+		self.bind_pairs = []
+		self.packed_streams = []
+		self.unpack_sizes = []
+		self.crc32 = None
+		self.num_unpack_streams = 1
+
+	@property
+	def unpack_size(self):
+		#The final output is whichever out stream isn't bound to the input of another coder
+		bound_out_streams = {out_index for _, out_index in self.bind_pairs}
+		for i, size in enumerate(self.unpack_sizes):
+			if i not in bound_out_streams:
+				return size
+		return self.unpack_sizes[-1] if self.unpack_sizes else 0
+
+class _StreamsInfo():
+	def __init__(self):
+		self.pack_pos = 0
+		self.pack_sizes = []
+		self.folders = []
+		self.substream_sizes = []
+		self.substream_crcs = []
+
+class _Reader():
+	def __init__(self, data):
+		self.data = data
+		self.pos = 0
+
+	def byte(self):
+		if self.pos >= len(self.data):
+			raise SevenZipHeaderException('Header ended unexpectedly')
+		b = self.data[self.pos]
+		self.pos += 1
+		return b
+
+	def read(self, length):
+		if self.pos + length > len(self.data):
+			raise SevenZipHeaderException('Header ended unexpectedly')
+		b = self.data[self.pos: self.pos + length]
+		self.pos += length
+		return b
+
+	def uint32(self):
+		return int.from_bytes(self.read(4), 'little')
+
+	def number(self):
+		#The first byte says how many more bytes there are by how many high bits are set, and the rest of it is the highest part of the number
+		first = self.byte()
+		mask = 0x80
+		value = 0
+		for i in range(8):
+			if not first & mask:
+				return value | ((first & (mask - 1)) << (8 * i))
+			value |= self.byte() << (8 * i)
+			mask >>= 1
+		return value
+
+	def count(self):
+		#How many of something there are; everything we read a count of takes up at least a byte of the header each, so if it says there's more than that, it's garbage (and we don't want to try and make a list that big)
+		value = self.number()
+		if value > len(self.data) - self.pos:
+			raise SevenZipHeaderException('Count is bigger than the header: {0}'.format(value))
+		return value
+
+	def bit_vector(self, count):
+		bits = []
+		mask = 0
+		current = 0
+		for _ in range(count):
+			if not mask:
+				current = self.byte()
+				mask = 0x80
+			bits.append(bool(current & mask))
+			mask >>= 1
+		return bits
+
+	def defined_vector(self, count):
+		all_are_defined = self.byte()
+		if all_are_defined:
+			return [True] * count
+		return self.bit_vector(count)
+
+	def digests(self, count):
+		defined = self.defined_vector(count)
+		return [self.uint32() if is_defined else None for is_defined in defined]
+
+def _read_pack_info(reader, streams_info):
+	streams_info.pack_pos = reader.number()
+	num_pack_streams = reader.count()
+	while True:
+		property_id = reader.number()
+		if property_id == k_end:
+			break
+		if property_id == k_size:
+			streams_info.pack_sizes = [reader.number() for _ in range(num_pack_streams)]
+		elif property_id == k_crc:
+			reader.digests(num_pack_streams)
+		else:
+			raise SevenZipHeaderException('Unexpected property in pack info: {0}'.format(property_id))
+
+def _read_folder(reader):
+	folder = _Folder()
+	num_coders = reader.count()
+	total_in_streams = 0
+	total_out_streams = 0
+	for _ in range(num_coders):
+		flags = reader.byte()
+		codec_id = bytes(reader.read(flags & 0x0f))
+		if flags & 0x10:
+			num_in_streams = reader.count()
+			num_out_streams = reader.count()
+		else:
+			num_in_streams = num_out_streams = 1
+		properties = bytes(reader.read(reader.number())) if flags & 0x20 else b''
+		if flags & 0x80:
+			raise SevenZipHeaderException('Alternative coder methods are not supported')
+		folder.coders.append((codec_id, num_in_streams, num_out_streams, properties))
+		total_in_streams += num_in_streams
+		total_out_streams += num_out_streams
+
+	folder.bind_pairs = [(reader.number(), reader.number()) for _ in range(total_out_streams - 1)]
+	num_packed_streams = total_in_streams - len(folder.bind_pairs)
+	if num_packed_streams == 1:
+		bound_in_streams = {in_index for in_index, _ in folder.bind_pairs}
+		folder.packed_streams = [next(i for i in range(total_in_streams) if i not in bound_in_streams)]
+	else:
+		folder.packed_streams = [reader.number() for _ in range(num_packed_streams)]
+	return folder
+
+def _read_unpack_info(reader, streams_info):
+	if reader.number() != k_folder:
+		raise SevenZipHeaderException('Expected folder info')
+	num_folders = reader.count()
+	if reader.byte():
+		raise SevenZipHeaderException('External folder info is not supported')
+	streams_info.folders = [_read_folder(reader) for _ in range(num_folders)]
+
+	if reader.number() != k_coders_unpack_size:
+		raise SevenZipHeaderException('Expected coder unpack sizes')
+	for folder in streams_info.folders:
+		folder.unpack_sizes = [reader.number() for _ in range(sum(coder[2] for coder in folder.coders))]
+
+	while True:
+		property_id = reader.number()
+		if property_id == k_end:
+			break
+		if property_id == k_crc:
+			for folder, crc in zip(streams_info.folders, reader.digests(num_folders)):
+				folder.crc32 = crc
+		else:
+			raise SevenZipHeaderException('Unexpected property in unpack info: {0}'.format(property_id))
+
+def _read_substreams_info(reader, streams_info):
+	folders = streams_info.folders
+	property_id = reader.number()
+	if property_id == k_num_unpack_stream:
+		for folder in folders:
+			folder.num_unpack_streams = reader.count()
+		property_id = reader.number()
+
+	sizes = []
+	if property_id == k_size:
+		for folder in folders:
+			if not folder.num_unpack_streams:
+				continue
+			folder_sizes = [reader.number() for _ in range(folder.num_unpack_streams - 1)]
+			folder_sizes.append(folder.unpack_size - sum(folder_sizes))
+			sizes += folder_sizes
+		property_id = reader.number()
+	else:
+		for folder in folders:
+			if folder.num_unpack_streams == 1:
+				sizes.append(folder.unpack_size)
+			elif folder.num_unpack_streams:
+				raise SevenZipHeaderException('Substream sizes missing')
+
+	#If a folder only has one stream, its CRC is the same as the folder's CRC, so that's not repeated here if the folder has one
+	unknown_crc_count = sum(folder.num_unpack_streams for folder in folders if not (folder.num_unpack_streams == 1 and folder.crc32 is not None))
+	crcs = None
+	while property_id != k_end:
+		if property_id == k_crc:
+			crcs = reader.digests(unknown_crc_count)
+		else:
+			raise SevenZipHeaderException('Unexpected property in substreams info: {0}'.format(property_id))
+		property_id = reader.number()
+
+	crc_index = 0
+	streams_info.substream_crcs = []
+	for folder in folders:
+		if folder.num_unpack_streams == 1 and folder.crc32 is not None:
+			streams_info.substream_crcs.append(folder.crc32)
+			continue
+		for _ in range(folder.num_unpack_streams):
+			streams_info.substream_crcs.append(crcs[crc_index] if crcs else None)
+			crc_index += 1
+	streams_info.substream_sizes = sizes
+
+def _read_streams_info(reader):
+	streams_info = _StreamsInfo()
+	has_substreams_info = False
+	while True:
+		property_id = reader.number()
+		if property_id == k_end:
+			break
+		if property_id == k_pack_info:
+			_read_pack_info(reader, streams_info)
+		elif property_id == k_unpack_info:
+			_read_unpack_info(reader, streams_info)
+		elif property_id == k_substreams_info:
+			_read_substreams_info(reader, streams_info)
+			has_substreams_info = True
+		else:
+			raise SevenZipHeaderException('Unexpected property in streams info: {0}'.format(property_id))
+
+	if not has_substreams_info:
+		streams_info.substream_sizes = [folder.unpack_size for folder in streams_info.folders]
+		streams_info.substream_crcs = [folder.crc32 for folder in streams_info.folders]
+	return streams_info
+
+def _decode_folder(f, streams_info, folder_index):
+	#Only used for the encoded header, which in practice is always just one LZMA (or LZMA2, or uncompressed) coder, so that's all that's supported here
+	folder = streams_info.folders[folder_index]
+	if len(folder.coders) != 1 or len(streams_info.pack_sizes) <= folder_index:
+		raise SevenZipHeaderException('Unsupported header compression')
+	codec_id, _, _, properties = folder.coders[0]
+
+	pack_offset = 32 + streams_info.pack_pos + sum(streams_info.pack_sizes[:folder_index])
+	f.seek(pack_offset)
+	packed = f.read(streams_info.pack_sizes[folder_index])
+
+	if codec_id == b'\x00':
+		data = packed
+	elif codec_id == b'\x03\x01\x01':
+		if len(properties) < 5:
+			raise SevenZipHeaderException('Invalid LZMA properties')
+		lc_lp_pb = properties[0]
+		lzma_filter = {
+			'id': lzma.FILTER_LZMA1,
+			'lc': lc_lp_pb % 9,
+			'lp': (lc_lp_pb // 9) % 5,
+			'pb': lc_lp_pb // 45,
+			'dict_size': int.from_bytes(properties[1:5], 'little'),
+		}
+		data = _raw_decompress(packed, lzma_filter, folder.unpack_size)
+	elif codec_id == b'\x21':
+		if not properties:
+			raise SevenZipHeaderException('Invalid LZMA2 properties')
+		dict_size_property = properties[0]
+		if dict_size_property > 40:
+			raise SevenZipHeaderException('Invalid LZMA2 dictionary size')
+		dict_size = 0xffffffff if dict_size_property == 40 else (2 | (dict_size_property & 1)) << (dict_size_property // 2 + 11)
+		data = _raw_decompress(packed, {'id': lzma.FILTER_LZMA2, 'dict_size': dict_size}, folder.unpack_size)
+	else:
+		#Probably encrypted (06F10701), in which case we couldn't read it anyway without a password
+		raise SevenZipHeaderException('Unsupported header coder: {0}'.format(codec_id.hex()))
+
+	data = data[:folder.unpack_size]
+	if folder.crc32 is not None and (zlib.crc32(data) & 0xffffffff) != folder.crc32:
+		raise SevenZipHeaderException('Header CRC mismatch')
+	return data
+
+def _raw_decompress(packed, lzma_filter, unpack_size):
+	decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=[lzma_filter])
+	try:
+		return decompressor.decompress(packed, max_length=unpack_size)
+	except lzma.LZMAError as ex:
+		raise SevenZipHeaderException('Could not decompress header: {0}'.format(ex))
+
+def _read_files_info(reader, streams_info):
+	num_files = reader.count()
+	empty_streams = [False] * num_files
+	empty_files = []
+	names = None
+	attributes = [None] * num_files
+
+	while True:
+		property_id = reader.number()
+		if property_id == k_end:
+			break
+		size = reader.number()
+		end = reader.pos + size
+		if property_id == k_empty_stream:
+			empty_streams = reader.bit_vector(num_files)
+		elif property_id == k_empty_file:
+			empty_files = reader.bit_vector(sum(empty_streams))
+		elif property_id == k_name:
+			if reader.byte():
+				raise SevenZipHeaderException('External names are not supported')
+			names = bytes(reader.read(end - reader.pos)).decode('utf-16-le').split('\0')[:num_files]
+		elif property_id == k_win_attributes:
+			defined = reader.defined_vector(num_files)
+			if reader.byte():
+				raise SevenZipHeaderException('External attributes are not supported')
+			attributes = [reader.uint32() if is_defined else None for is_defined in defined]
+		#Anything else (timestamps, anti-items, padding) we don't care about
+		reader.pos = end
+
+	if names is None or len(names) != num_files:
+		raise SevenZipHeaderException('File names missing')
+
+	entries = []
+	stream_index = 0
+	empty_index = 0
+	for i, name in enumerate(names):
+		attribute = attributes[i]
+		if empty_streams[i]:
+			is_empty_file = empty_files[empty_index] if empty_index < len(empty_files) else False
+			empty_index += 1
+			is_directory = not is_empty_file
+			if attribute is not None:
+				is_directory = bool(attribute & file_attribute_directory)
+			entries.append(SevenZipEntry(name, 0, None if is_directory else 0, attribute, is_directory))
+		else:
+			if stream_index >= len(streams_info.substream_sizes):
+				raise SevenZipHeaderException('More files than streams')
+			size = streams_info.substream_sizes[stream_index]
+			crc = streams_info.substream_crcs[stream_index] if stream_index < len(streams_info.substream_crcs) else None
+			stream_index += 1
+			entries.append(SevenZipEntry(name, size, crc, attribute, False))
+	return entries
+
+def _read_header(reader):
+	streams_info = _StreamsInfo()
+	while True:
+		property_id = reader.number()
+		if property_id == k_end:
+			return []
+		if property_id == k_archive_properties:
+			while reader.number() != k_end:
+				reader.read(reader.number())
+		elif property_id == k_additional_streams_info:
+			_read_streams_info(reader)
+		elif property_id == k_main_streams_info:
+			streams_info = _read_streams_info(reader)
+		elif property_id == k_files_info:
+			entries = _read_files_info(reader, streams_info)
+			if reader.number() != k_end:
+				raise SevenZipHeaderException('Expected end of header')
+			return entries
+		else:
+			raise SevenZipHeaderException('Unexpected property in header: {0}'.format(property_id))
+
+def read_entries(path):
+	with open(path, 'rb') as f:
+		try:
+			return _read_entries(f)
+		except (IndexError, ValueError, OverflowError, StopIteration, lzma.LZMAError) as ex:
+			#ValueError includes UnicodeDecodeError from mangled names; either way, this is something we didn't expect to be in a header, so we can't trust anything else in it
+			raise SevenZipHeaderException('Invalid header: {0!r}'.format(ex)) from ex
+
+def _read_entries(f):
+	start_header = f.read(32)
+	if len(start_header) < 32 or start_header[:6] != signature:
+		raise SevenZipHeaderException('Not a 7z file')
+	if (zlib.crc32(start_header[12:32]) & 0xffffffff) != int.from_bytes(start_header[8:12], 'little'):
+		raise SevenZipHeaderException('Start header CRC mismatch')
+	next_header_offset = int.from_bytes(start_header[12:20], 'little')
+	next_header_size = int.from_bytes(start_header[20:28], 'little')
+	next_header_crc = int.from_bytes(start_header[28:32], 'little')
+	if not next_header_size:
+		#Empty archive
+		return []
+
+	f.seek(32 + next_header_offset)
+	header = f.read(next_header_size)
+	if len(header) != next_header_size or (zlib.crc32(header) & 0xffffffff) != next_header_crc:
+		raise SevenZipHeaderException('Header CRC mismatch')
+
+	reader = _Reader(header)
+	property_id = reader.number()
+	while property_id == k_encoded_header:
+		#The actual header is compressed, and this just tells us how to get at it
+		encoded_streams_info = _read_streams_info(reader)
+		if not encoded_streams_info.folders:
+			raise SevenZipHeaderException('Encoded header has no folders')
+		reader = _Reader(_decode_folder(f, encoded_streams_info, 0))
+		property_id = reader.number()
+
+	if property_id != k_header:
+		raise SevenZipHeaderException('Unexpected header type: {0}'.format(property_id))
+	return _read_header(reader)
@@ -3,6 +3,7 @@ import re
 import xml.etree.ElementTree as ElementTree
 import zlib
 
+import hash_cache
 import io_utils
 from common import (find_filename_tags_at_end, normalize_name,
                     remove_filename_tags, byteswap)
@@ -678,6 +679,9 @@ def matcher_args_for_bytes(data):
 	#We _could_ use sha1 here, but there's not really a need to
 	return SoftwareMatcherArgs(get_crc32_for_software_list(data), None, len(data), lambda offset, amount: data[offset:offset+amount])
 
+def matcher_args_for_rom(rom):
+	return SoftwareMatcherArgs(format_crc32_for_software_list(rom.get_crc32()), None, rom.get_size() - rom.header_length_for_crc_calculation, lambda offset, amount: rom.read(seek_to=offset, amount=amount))
+
 def get_software_list_entry(game, skip_header=0):
 	if game.software_lists:
 		software_lists = game.software_lists
@@ -689,7 +693,7 @@ def get_software_list_entry(game, skip_header=0):
 		software = None
 		if game.rom.extension == 'chd':
 			try:
-				sha1 = get_sha1_from_chd(game.rom.path)
+				sha1 = hash_cache.get_hash(game.rom.path, None, 0, 'chd_sha1', lambda: get_sha1_from_chd(game.rom.path))
 				args = SoftwareMatcherArgs(None, sha1, None, None)
 				software = find_in_software_lists(software_lists, args)
 			except UnsupportedCHDError:
@@ -706,10 +710,10 @@ def get_software_list_entry(game, skip_header=0):
 				software = find_in_software_lists(software_lists, matcher_args_for_bytes(data))
 			else:
 				if game.system.databases_are_byteswapped:
-					crc32 = format_crc32_for_software_list(zlib.crc32(byteswap(game.rom.read())) & 0xffffffff)
+					crc32 = format_crc32_for_software_list(game.rom.get_digest('byteswapped_crc32'))
+					args = SoftwareMatcherArgs(crc32, None, game.rom.get_size() - game.rom.header_length_for_crc_calculation, lambda offset, amount: byteswap(game.rom.read(seek_to=offset, amount=amount)))
 				else:
-					crc32 = format_crc32_for_software_list(game.rom.get_crc32())
-				args = SoftwareMatcherArgs(crc32, None, game.rom.get_size() - game.rom.header_length_for_crc_calculation, lambda offset, amount: byteswap(game.rom.read(seek_to=offset, amount=amount)) if game.system.databases_are_byteswapped else game.rom.read(seek_to=offset, amount=amount))
+					args = matcher_args_for_rom(game.rom)
 				software = find_in_software_lists(software_lists, args)
 
 	if not software and (game.system_name in main_config.find_software_by_name):